@@ -2,11 +2,14 @@
 # Thème Medicalis Blue + Vert Santé (clair) + correctifs expanders + suggestions
 # Streamlit >= 1.33
 
-import unicodedata
+import time
 from pathlib import Path
 import pandas as pd
 import streamlit as st
 
+from medsim import RANKINGS, Catalogue, LiveEngine, SuggestState, metrics
+from medsim.metrics import Trace, stage
+
 # ---------------- CONFIG ----------------
 st.set_page_config(
     page_title="Similaires Médicaments – Maroc",
@@ -201,35 +204,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------------- HELPERS ----------------
-def strip_accents(s: str) -> str:
-    if not s: return s
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def norm_pipes_lower(x: str) -> str:
-    if not x: return ""
-    x = x.replace(" / ", " | ").replace("/", " / ")
-    if "|" not in x and "," in x:
-        x = " | ".join([p.strip() for p in x.split(",")])
-    parts = [strip_accents(p).lower().strip() for p in x.split("|") if p.strip()]
-    return " | ".join(parts)
-
-def norm_forme(x: str) -> str:
-    s = strip_accents(str(x)).lower().strip()
-    s = s.replace("comp.", "comprime").replace("cp", "comprime")
-    if "comprime" in s: return "COMPRIME"
-    if "gelule" in s: return "GELULE"
-    if "sirop" in s: return "SIROP"
-    if "solution" in s: return "SOLUTION"
-    if "poudre" in s: return "POUDRE"
-    if "capsule" in s: return "CAPSULE"
-    if "suspension" in s: return "SUSPENSION"
-    if "collyre" in s: return "COLLYRE"
-    return s.upper()[:40] if s else ""
-
-def split_set_norm(x: str) -> set:
-    if not x: return set()
-    return {strip_accents(t).lower().strip() for t in x.split("|") if t.strip()}
-
 def pretty_card(row: pd.Series) -> str:
     p = row.get("presentation_pretty","") or row.get("presentation","")
     d = row.get("dosage_pretty","") or row.get("grammages","")
@@ -242,175 +216,228 @@ def pretty_card(row: pd.Series) -> str:
     if row.get("classe_therapeutique",""): bloc.append(f"**Classe thérapeutique** : {row['classe_therapeutique']}")
     if row.get("statut",""): bloc.append(f"**Statut** : {row['statut']}")
     if row.get("atc_code",""): bloc.append(f"**Code ATC** : {row['atc_code']}")
+    if row.get("ppv_value",""): bloc.append(f"**PPV** : {row['ppv_value']}")
+    if row.get("prix_hospitalier",""): bloc.append(f"**Prix hospitalier** : {row['prix_hospitalier']}")
     return "  \n".join(bloc)
 
 # ---------------- DATA ----------------
 DEFAULT_CSV = "data_full_with_dr_luna.csv"
+ORDER_LABELS = {"statut": "Commercialisés, puis nom", "prix": "Prix public (PPV) croissant",
+                "prix_unitaire": "Prix par unité croissant"}
+ATC_LABELS = {5: "Même code (niveau 5)", 4: "Même sous-groupe chimique (niveau 4)",
+              3: "Même sous-groupe pharmacologique (niveau 3)", 2: "Même groupe thérapeutique (niveau 2)",
+              1: "Même groupe anatomique (niveau 1)"}
+
+@st.cache_resource(show_spinner=False)
+def live_engine(csv_path: str) -> LiveEngine:
+    # un moteur par chemin, partagé par les sessions : un CSV modifié est rechargé de façon
+    # incrémentale, les autres sessions restant servies par l'ancien moteur entre-temps ;
+    # le premier chargement se fait en arrière-plan (page d'attente en attendant)
+    return LiveEngine(csv_path).start()
+
+@st.cache_resource(show_spinner=False)
+def catalogue(directory: str) -> Catalogue:
+    # catalogue partitionné par pays : une partition n'est chargée qu'à sa première sélection
+    return Catalogue(directory)
+
+# ---------------- MESURES (?debug=1 ou MEDSIM_TRACE=1) ----------------
+DEBUG = st.query_params.get("debug") == "1" or metrics.ENABLED
+trace = Trace("rerun", profile=st.session_state.pop("profile_next", False)).start() if DEBUG else None
 
 @st.cache_data(show_spinner=False)
-def load_data(csv_path: str) -> pd.DataFrame:
-    df = pd.read_csv(csv_path, dtype=str).fillna("")
-    expected = {
-        "specialite","molecules","grammages","forme","statut",
-        "classe_therapeutique","atc_code","presentation",
-        "composition_pretty","dosage_pretty","presentation_pretty",
-        "detail_url","labo"
-    }
-    for m in expected:
-        if m not in df.columns: df[m] = ""
-    df["molecules_norm"]  = df["molecules"].apply(norm_pipes_lower)
-    df["forme_norm"]      = df["forme"].apply(norm_forme)
-    df["grammages_norm"]  = df["grammages"].apply(norm_pipes_lower)
-    df["brand_key"]       = df["specialite"].apply(lambda s: strip_accents(s).lower())
-    return df
-
-# ---------------- LOGIQUE DE SIMILARITÉ ----------------
-def find_reference(df: pd.DataFrame, query: str) -> pd.Series | None:
-    if not query: return None
-    qn = strip_accents(query).lower().strip()
-    brand_norm = df["specialite"].astype(str).apply(lambda s: strip_accents(s).lower())
-    mask_sw = brand_norm.str.startswith(qn)
-    if mask_sw.any():
-        return df[mask_sw].iloc[0]
-    # Fallback fuzzy (optionnel)
-    try:
-        from rapidfuzz import process, fuzz
-        best = process.extractOne(query, df["specialite"].tolist(), scorer=fuzz.WRatio)
-        if best and best[1] >= 75:
-            return df.iloc[df["specialite"].tolist().index(best[0])]
-        best2 = process.extractOne(query, df["molecules"].tolist(), scorer=fuzz.WRatio)
-        if best2 and best2[1] >= 75:
-            return df.iloc[df["molecules"].tolist().index(best2[0])]
-    except Exception:
-        pass
-    if "brand_key" in df.columns:
-        ct = df["brand_key"].str.contains(qn, na=False)
-        if ct.any(): return df[ct].iloc[0]
-    return None
-
-def group_similars(df: pd.DataFrame, ref: pd.Series) -> dict:
-    ref_mols = split_set_norm(ref.get("molecules_norm",""))
-    ref_form = ref.get("forme_norm","")
-    ref_dos  = split_set_norm(ref.get("grammages_norm",""))
-    ref_atc  = (ref.get("atc_code","") or "").strip()
-    tiers = {"A": [], "B": [], "C": [], "D": []}
-    for _, r in df.iterrows():
-        if r["specialite"] == ref["specialite"] and r.get("detail_url","") == ref.get("detail_url",""):
-            continue
-        mols = split_set_norm(r.get("molecules_norm",""))
-        same_inn_exact  = (mols == ref_mols and len(mols) > 0)
-        same_inn_subset = (len(ref_mols) > 0 and ref_mols.issubset(mols))
-        same_form       = (r.get("forme_norm","") == ref_form and ref_form != "")
-        dos             = split_set_norm(r.get("grammages_norm",""))
-        if same_inn_exact and same_form and dos and (dos == ref_dos):
-            tiers["A"].append(r); continue
-        if (same_inn_exact or same_inn_subset) and same_form:
-            tiers["B"].append(r); continue
-        if (same_inn_exact or same_inn_subset):
-            tiers["C"].append(r); continue
-        if ref_atc and r.get("atc_code","").strip() == ref_atc:
-            tiers["D"].append(r); continue
-    def sort_key(sr):
-        return (0 if (str(sr.get("statut","")).lower().startswith("com")) else 1, sr.get("specialite",""))
-    for k in tiers:
-        tiers[k] = sorted(tiers[k], key=sort_key)
-    return tiers
-
-# ---------------- STATE : input robuste + suggestions qui remplissent ----------------
-if "query" not in st.session_state:
-    st.session_state["query"] = ""
-if "pending_query" in st.session_state:
-    st.session_state["query"] = st.session_state.pop("pending_query")
-
-# ---------------- INTERFACE ----------------
-with st.sidebar:
-    st.markdown("### ⚙️ Données")
-    csv_path = st.text_input("Chemin du CSV", value=DEFAULT_CSV)
-    df = load_data(csv_path) if Path(csv_path).exists() else pd.DataFrame()
-    st.markdown("### 🔎 Filtres")
-    formes = sorted([f for f in df.get("forme_norm", pd.Series()).unique().tolist() if f]) if not df.empty else []
-    forme_filter = st.multiselect("Forme", formes, default=[])
-    statuts = sorted([s for s in df.get("statut", pd.Series()).unique().tolist() if s]) if not df.empty else []
-    statut_filter = st.multiselect("Statut", statuts, default=[])
-
-query = st.text_input("Rechercher", placeholder="Nom commercial ou DCI…",
-                      label_visibility="collapsed", key="query")
-
-if df.empty: st.stop()
-mask = pd.Series(True, index=df.index)
-if forme_filter: mask &= df["forme_norm"].isin(forme_filter)
-if statut_filter: mask &= df["statut"].isin(statut_filter)
-df_view = df[mask].copy()
-
-# ---------------- AUTOCOMPLÉTION ----------------
-def suggest_matches(df_src, q, max_suggestions=8):
-    qn = strip_accents(q).lower().strip()
-    if not qn: return []
-    brands = df_src["specialite"].astype(str).tolist()
-    dci = df_src["molecules"].astype(str).tolist()
-    combos = brands + dci
-    seen, out = set(), []
-    for val in combos:
-        vn = strip_accents(val).lower()
-        if vn.startswith(qn) and val not in seen:
-            out.append(val); seen.add(val)
-            if len(out)>=max_suggestions: break
-    if len(out)<max_suggestions:
-        for val in combos:
-            vn = strip_accents(val).lower()
-            if qn in vn and val not in seen:
-                out.append(val); seen.add(val)
-                if len(out)>=max_suggestions: break
-    return out[:max_suggestions]
-
-if query.strip():
-    sugs = suggest_matches(df_view, query)
-    if sugs:
-        st.caption("Suggestions :")
-        cols = st.columns(min(6, len(sugs)))
-        for i,s in enumerate(sugs):
-            with cols[i%len(cols)]:
-                if st.button(s, key=f"sugg_{i}_{abs(hash(s))%100000}"):
-                    st.session_state["pending_query"] = s
-                    st.rerun()
-
-# ---------------- RÉSULTATS ----------------
-def status_pill(text: str) -> str:
-    if not text: return ""
-    cls = "ok" if str(text).lower().startswith("com") else "off"
-    return f'<span class="status {cls}">{text}</span>'
-
-if query.strip():
-    ref = find_reference(df_view, query.strip())
-    if ref is None:
-        st.warning("Aucun résultat proche. Essaie une autre orthographe ou enlève des filtres.")
-        st.stop()
-
-    st.markdown(f'<div class="card"><h3 style="margin:0;">Référence : {ref["specialite"]} — {ref.get("forme","")}</h3></div>', unsafe_allow_html=True)
-    with st.expander("Voir les détails de la référence", expanded=False):
-        st.markdown(pretty_card(ref), unsafe_allow_html=True)
-
-    tiers = group_similars(df_view, ref)
-    colA, colB, colC, colD = st.columns(4)
-
-    def show_bucket(col, title, rows):
-        with col:
-            st.markdown(f"<div class='tier-title'><h3>{title}</h3> <span class='badge'>{len(rows)} résultat(s)</span></div>", unsafe_allow_html=True)
-            if not rows:
-                st.caption("Rien pour le moment. Affine la recherche ou les filtres.")
-                return
-            for r in rows[:200]:
-                label = f"{r['specialite']} — {r.get('forme','')}"
-                with st.expander(label, expanded=False):
-                    line = f"DCI : {r.get('molecules','')}"
-                    atc  = f" | ATC : {r.get('atc_code','')}" if r.get('atc_code','') else ""
-                    st.caption(line + atc)
+def memory_summary(fingerprint: str, _engine) -> dict:
+    # parcours complet de l'index : une fois par jeu de données
+    return _engine.memory_report()
+
+def finish_run():
+    """Termine la trace du rerun et l'affiche dans la sidebar (mode debug seulement)."""
+    if trace is None or trace.token is None: return  # pas de mesure, ou déjà affichée
+    trace.finish()
+    with debug_box or st.sidebar:
+        st.markdown("### ⏱️ Mesures du rerun")
+        st.caption(f"Total : {trace.total_ms:.1f} ms")
+        if trace.stages:
+            st.markdown("| étape | ms | appels |\n|---|---:|---:|\n" + "\n".join(
+                f"| {k} | {v[0]:.2f} | {v[1]} |" for k, v in trace.stages.items()))
+        if trace.counters:
+            st.json(dict(trace.counters))
+        if engine is not None:
+            st.caption("Cache de résultats : " + ", ".join(f"{k} {v}" for k, v in engine.results.stats().items()))
+            mem = memory_summary(engine.fingerprint, engine)
+            st.caption(f"Mémoire : données {mem['frame_mb']} Mo, index {mem['index_mb']} Mo ({mem['rows']} lignes)")
+        if st.button("Profiler la prochaine exécution", key="profile_btn"):
+            st.session_state["profile_next"] = True
+            st.rerun()
+        if trace.profile_text:
+            st.code(trace.profile_text, language="text")
+
+class EndRun(Exception):
+    """Fin anticipée du rerun, à la place de st.stop() : après st.stop(), plus rien ne
+    s'affiche, pas même les mesures."""
+
+engine = debug_box = None  # lus par finish_run, même si le rerun s'arrête avant
+
+# la trace est terminée à toute sortie : fin du script, EndRun ou st.rerun() (boutons
+# « Afficher plus », suggestions…) ; elle n'est pas affichée après st.rerun(), la page
+# étant alors redessinée
+try:
+    # ---------------- STATE : input robuste + suggestions qui remplissent ----------------
+    if "query" not in st.session_state:
+        st.session_state["query"] = ""
+    if "pending_query" in st.session_state:
+        st.session_state["query"] = st.session_state.pop("pending_query")
+
+    # ---------------- INTERFACE ----------------
+    with st.sidebar:
+        st.markdown("### ⚙️ Données")
+        csv_path = st.text_input("Chemin du CSV (ou répertoire de partitions par pays)", value=DEFAULT_CSV)
+        live = None
+        if Path(csv_path).is_dir():
+            countries = catalogue(csv_path).countries()
+            pays = st.multiselect("Pays", countries, default=countries[:1])
+            with stage("load"):
+                engine = catalogue(csv_path).engine(pays)
+        else:
+            with stage("load"):
+                live = live_engine(csv_path) if Path(csv_path).exists() else None
+                engine = live.get() if live is not None and live.ready else None
+        st.markdown("### 🔎 Filtres")
+        formes = engine.formes if engine is not None else []
+        forme_filter = st.multiselect("Forme", formes, default=[])
+        statuts = engine.statuts if engine is not None else []
+        statut_filter = st.multiselect("Statut", statuts, default=[])
+        order = st.selectbox("Classer les tiers par", RANKINGS, format_func=ORDER_LABELS.get)
+        atc_level = st.selectbox("Tier D : voisins ATC", (5, 4, 3, 2, 1), format_func=ATC_LABELS.get)
+        debug_box = st.container() if DEBUG else None
+
+    molecule_mode = st.toggle("Requête par molécules (ET / OU / SAUF)", key="molecule_mode")
+    query = st.text_input("Rechercher", label_visibility="collapsed", key="query",
+                          placeholder="ex. amoxicilline et acide clavulanique" if molecule_mode else "Nom commercial ou DCI…")
+
+    # ---------------- PRÉCHAUFFAGE ----------------
+    if live is not None and not live.ready:
+        # page d'attente plutôt que page blanche : étape en cours, et suggestions par préfixe
+        # du nom commercial dès que le jeu est lu (l'index complet n'est pas encore prêt)
+        status = live.status()
+        if status["state"] == "error":
+            st.error(f"Chargement impossible : {status['error']}")
+            if st.button("Réessayer"):
+                live.start()
+                st.rerun()
+            raise EndRun
+        st.info(f"⏳ Préparation du catalogue ({status['stage']}, {status['seconds']:.0f} s)…")
+        if query.strip() and not molecule_mode and live.partial is not None:
+            sugs = live.partial.suggest(query)
+            st.caption("Suggestions (noms commerciaux) : " + (", ".join(sugs) if sugs else "aucune"))
+        finish_run()  # mesure du rerun sans l'attente
+        time.sleep(0.5)
+        st.rerun()
+
+    if engine is None:
+        raise EndRun
+
+    # ---------------- AUTOCOMPLÉTION ----------------
+    if query.strip() and not molecule_mode:
+        # état propre à la session : une saisie qui prolonge la précédente affine ses candidats
+        sugs = engine.suggest(query, forme_filter, statut_filter,
+                              state=st.session_state.setdefault("suggest_state", SuggestState()))
+        if sugs:
+            st.caption("Suggestions :")
+            cols = st.columns(min(6, len(sugs)))
+            for i,s in enumerate(sugs):
+                with cols[i%len(cols)]:
+                    if st.button(s, key=f"sugg_{i}_{abs(hash(s))%100000}"):
+                        st.session_state["pending_query"] = s
+                        st.rerun()
+
+    # ---------------- RÉSULTATS ----------------
+    def status_pill(text: str) -> str:
+        if not text: return ""
+        cls = "ok" if str(text).lower().startswith("com") else "off"
+        return f'<span class="status {cls}">{text}</span>'
+
+    PAGE_SIZE = 20  # cartes par tier et par page
+
+    # ---------------- REQUÊTE PAR MOLÉCULES ----------------
+    if query.strip() and molecule_mode:
+        search_key = ("molecules", query.strip(), tuple(forme_filter), tuple(statut_filter), order)
+        if st.session_state.get("shown_for") != search_key:
+            st.session_state["shown_for"] = search_key
+            st.session_state["shown"] = {}
+        shown = st.session_state["shown"].get("M", PAGE_SIZE)
+        try:
+            positions, terms = engine.molecule_query(query.strip(), forme_filter, statut_filter, order, shown)
+        except ValueError as e:
+            st.warning(f"Requête invalide : {e}")
+            raise EndRun
+        st.caption(" · ".join(f"« {t} » → {', '.join(m) if m else 'aucune molécule'}" for t, m in terms.items()))
+        st.markdown(f"<div class='tier-title'><h3>Produits</h3> <span class='badge'>{len(positions)} résultat(s)</span></div>",
+                    unsafe_allow_html=True)
+        with stage("render"):
+            for r in engine.rows(positions[:shown]):
+                with st.expander(f"{r['specialite']} — {r.get('forme','')}", expanded=False):
+                    st.caption(f"DCI : {r.get('molecules','')}")
                     st.markdown(pretty_card(r), unsafe_allow_html=True)
                     st.markdown(status_pill(r.get("statut","")), unsafe_allow_html=True)
+        rest = len(positions) - shown
+        if rest > 0 and st.button(f"Afficher plus ({rest} restant(s))", key="more_M"):
+            st.session_state["shown"]["M"] = shown + PAGE_SIZE
+            st.rerun()
+        raise EndRun
+
+    if query.strip():
+        # pagination propre à chaque recherche : on repart de la 1re page si la requête, les filtres ou l'ordre changent
+        search_key = (query.strip(), tuple(forme_filter), tuple(statut_filter), order, atc_level)
+        if st.session_state.get("shown_for") != search_key:
+            st.session_state["shown_for"] = search_key
+            st.session_state["shown"] = {}
+        # seules les cartes affichées ont besoin d'être classées : sélection partielle des premières
+        top = max(st.session_state["shown"].values(), default=PAGE_SIZE)
+        ref, tiers = engine.search(query.strip(), forme_filter, statut_filter, order, top, atc_level)
+        if ref is None:
+            st.warning("Aucun résultat proche. Essaie une autre orthographe ou enlève des filtres.")
+            raise EndRun
+
+        st.markdown(f'<div class="card"><h3 style="margin:0;">Référence : {ref["specialite"]} — {ref.get("forme","")}</h3></div>', unsafe_allow_html=True)
+        with st.expander("Voir les détails de la référence", expanded=False):
+            st.markdown(pretty_card(ref), unsafe_allow_html=True)
+
+        colA, colB, colC, colD = st.columns(4)
+
+        def show_bucket(col, title, k):
+            positions = tiers[k]
+            with col:
+                st.markdown(f"<div class='tier-title'><h3>{title}</h3> <span class='badge'>{len(positions)} résultat(s)</span></div>", unsafe_allow_html=True)
+                if not positions:
+                    st.caption("Rien pour le moment. Affine la recherche ou les filtres.")
+                    return
+                shown = st.session_state["shown"].get(k, PAGE_SIZE)
+                # seules les lignes des pages affichées sont extraites du DataFrame
+                for r in engine.rows(positions[:shown]):
+                    label = f"{r['specialite']} — {r.get('forme','')}"
+                    with st.expander(label, expanded=False):
+                        line = f"DCI : {r.get('molecules','')}"
+                        atc  = f" | ATC : {r.get('atc_code','')}" if r.get('atc_code','') else ""
+                        st.caption(line + atc)
+                        st.markdown(pretty_card(r), unsafe_allow_html=True)
+                        st.markdown(status_pill(r.get("statut","")), unsafe_allow_html=True)
+                rest = len(positions) - shown
+                if rest > 0 and st.button(f"Afficher plus ({rest} restant(s))", key=f"more_{k}"):
+                    st.session_state["shown"][k] = shown + PAGE_SIZE
+                    st.rerun()
 
-    show_bucket(colA, "A — Substituables", tiers["A"])
-    show_bucket(colB, "B — Équivalents (forme =)", tiers["B"])
-    show_bucket(colC, "C — Même DCI (formes ≠)", tiers["C"])
-    show_bucket(colD, "D — Proches thérapeutiques (ATC)", tiers["D"])
-else:
-    st.markdown('<div class="card"><em>Commence à taper un médicament pour lancer la recherche.</em></div>', unsafe_allow_html=True)
+        with stage("render"):
+            show_bucket(colA, "A — Substituables", "A")
+            show_bucket(colB, "B — Équivalents (forme =)", "B")
+            show_bucket(colC, "C — Même DCI (formes ≠)", "C")
+            show_bucket(colD, "D — Proches thérapeutiques (ATC)", "D")
+            with colD:
+                levels = engine.atc_counts(ref.name)
+                if levels:
+                    st.caption("Produits par niveau ATC : " + " · ".join(f"{p} {c}" for p, c in levels.values()))
+    else:
+        st.markdown('<div class="card"><em>Commence à taper un médicament pour lancer la recherche.</em></div>', unsafe_allow_html=True)
+except EndRun:
+    pass
+finally:
+    finish_run()
@@ -0,0 +1,35 @@
+# medsim — moteur de similarité des médicaments, sans dépendance à Streamlit.
+#
+#   from medsim import SimilarityEngine
+#   eng = SimilarityEngine.from_csv("data_full_with_dr_luna.csv")
+#   ref = eng.find_reference("doliprane")
+#   tiers = eng.group_similars(ref)
+#
+# `import medsim` reste léger : pandas n'est chargé qu'au premier accès au moteur.
+
+from .normalize import norm_forme, norm_pipes_lower, split_set_norm, strip_accents
+
+_LAZY = {
+    "SimilarityEngine": "engine",
+    "LiveEngine": "engine",
+    "SuggestState": "engine",
+    "Catalogue": "partitions",
+    "load_data": "engine",
+    "prepare_frame": "engine",
+    "TIERS": "engine",
+    "RANKINGS": "engine",
+    "build_index": "index",
+    "ResultCache": "cache",
+    "RESULTS": "cache",
+    "Trace": "metrics",
+}
+
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        return getattr(import_module(f".{_LAZY[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ["SimilarityEngine", "LiveEngine", "SuggestState", "Catalogue", "load_data", "prepare_frame", "build_index", "TIERS", "RANKINGS",
+           "ResultCache", "RESULTS", "Trace",
+           "norm_forme", "norm_pipes_lower", "split_set_norm", "strip_accents"]
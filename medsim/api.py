@@ -0,0 +1,295 @@
+# medsim/api.py — API HTTP/JSON locale (asyncio, bibliothèque standard) sur le moteur
+#
+#   python -m medsim.api --data data_full_with_dr_luna.csv --port 8765
+#
+#   GET /health
+#   GET /suggest?q=amox&forme=COMPRIME&statut=Commercialisé&limit=8&session=onglet-42
+#   GET /reference?q=doliprane
+#   GET /similars?q=doliprane&forme=COMPRIME&limit=50&order=prix   (statut | prix | prix_unitaire)
+#   GET /similars?q=coversyl&atc_level=4          (tier D : même préfixe ATC de niveau 4, C09AA)
+#   GET /doses?q=levothyrox&tolerance=10          (mêmes molécules et forme, dosage à ±10 %)
+#   GET /molecules?q=paracetamol sauf codeine&forme=COMPRIME&order=prix&limit=50   (ET / OU / SAUF)
+#
+# Mêmes données et même logique que app.py (SimilarityEngine, cache de résultats partagé).
+# La boucle asyncio ne fait que lire et écrire les requêtes : la recherche s'exécute dans
+# un pool de threads, au plus --concurrency à la fois ; au-delà de --max-pending requêtes
+# en attente, l'API répond 503 au lieu d'allonger la file.
+#
+# /suggest avec ``session`` (un identifiant par champ de saisie côté client) : les candidats
+# de la frappe précédente sont affinés au lieu d'être recherchés dans tout l'index, et une
+# requête encore en file quand une plus récente de la même session arrive n'est pas calculée
+# (réponse « superseded ») : seules les dernières frappes d'une rafale coûtent une recherche.
+#
+# Le serveur écoute dès son lancement ; le CSV est chargé, indexé et préchauffé en arrière-plan.
+# Jusque-là /health répond 503 avec l'étape en cours (à utiliser comme sonde de disponibilité
+# lors d'un déploiement progressif), /suggest répond par préfixe du nom commercial dès que le
+# jeu est lu (« partial »), et les autres routes répondent 503.
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from . import metrics
+from .engine import RANKINGS, TIERS, LiveEngine, SuggestState
+
+DEFAULT_DATA = "data_full_with_dr_luna.csv"
+FIELDS = ("specialite", "molecules", "grammages", "forme", "statut", "atc_code", "labo", "detail_url",
+          "ppv_value", "prix_hospitalier")
+MAX_LIMIT = 200
+MAX_SESSIONS = 10_000  # sessions d'autocomplétion gardées (LRU)
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+log = logging.getLogger("medsim.api")
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def param(params: dict, name: str, default: str = "") -> str:
+    return (params.get(name) or [default])[0].strip()
+
+def limit_param(params: dict, default: int) -> int:
+    try:
+        return max(1, min(MAX_LIMIT, int(param(params, "limit", str(default)))))
+    except ValueError:
+        raise ApiError(400, "limit doit être un entier") from None
+
+def tolerance_param(params: dict) -> float:
+    try:
+        pct = float(param(params, "tolerance", "0"))
+    except ValueError:
+        raise ApiError(400, "tolerance doit être un nombre (pourcentage)") from None
+    if not 0 <= pct <= 100:
+        raise ApiError(400, "tolerance doit être comprise entre 0 et 100")
+    return pct / 100
+
+def order_param(params: dict) -> str:
+    order = param(params, "order", "statut")
+    if order not in RANKINGS:
+        raise ApiError(400, f"order doit valoir {' | '.join(RANKINGS)}")
+    return order
+
+def atc_level_param(params: dict) -> int:
+    level = param(params, "atc_level", "5")
+    if level not in ("1", "2", "3", "4", "5"):
+        raise ApiError(400, "atc_level doit être un entier de 1 à 5")
+    return int(level)
+
+def query_param(params: dict) -> str:
+    q = param(params, "q")
+    if not q:
+        raise ApiError(400, "paramètre q manquant")
+    return q
+
+class Session:
+    """Saisie d'un client de /suggest : numéro de sa dernière requête arrivée et état
+    d'autocomplétion (un seul calcul à la fois par session)."""
+
+    __slots__ = ("latest", "state", "lock")
+
+    def __init__(self):
+        self.latest = 0
+        self.state = SuggestState()
+        self.lock = threading.Lock()
+
+class SimilarityApi:
+    """Routes JSON sur un LiveEngine (rechargé de façon incrémentale si le CSV change)."""
+
+    def __init__(self, live: LiveEngine, concurrency: int = 8, max_pending: int = 256):
+        self.live = live
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="medsim-api")
+        self.slots = asyncio.Semaphore(concurrency)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.sessions = OrderedDict()  # identifiant -> Session, manipulé sur la boucle seulement
+        self.routes = {"/suggest": self.suggest, "/reference": self.reference, "/similars": self.similars,
+                       "/doses": self.doses, "/molecules": self.molecules}
+
+    # ---------------- ROUTES (exécutées hors de la boucle) ----------------
+    def suggest(self, params: dict, ticket: tuple | None = None) -> dict:
+        q = query_param(params)
+        limit = limit_param(params, 8)
+        partial = self.live.partial  # lu avant ready : n'est retiré qu'une fois le moteur prêt
+        if not self.live.ready:
+            if partial is None:
+                raise ApiError(503, "chargement en cours, réessayer plus tard")
+            return {"query": q, "suggestions": partial.suggest(q, limit), "partial": True}
+        engine = self.live.get()
+        if ticket is None:
+            return {"query": q, "suggestions": engine.suggest(q, params.get("forme", []), params.get("statut", []), limit)}
+        session, seq = ticket
+        if seq != session.latest:  # une frappe plus récente attend déjà : inutile de calculer celle-ci
+            return {"query": q, "suggestions": [], "superseded": True}
+        with session.lock:
+            sugs = engine.suggest(q, params.get("forme", []), params.get("statut", []), limit, session.state)
+        return {"query": q, "suggestions": sugs}
+
+    def reference(self, params: dict) -> dict:
+        q = query_param(params)
+        engine = self.live.get()
+        pos = engine.reference_position(q, params.get("forme", []), params.get("statut", []))
+        return {"query": q, "reference": None if pos is None else engine.records([pos], FIELDS)[0]}
+
+    def similars(self, params: dict) -> dict:
+        q = query_param(params)
+        limit = limit_param(params, 50)
+        engine = self.live.get()
+        # seules les `limit` premières de chaque tier sont renvoyées : elles seules sont triées
+        ref, tiers = engine.search(q, params.get("forme", []), params.get("statut", []), order_param(params), limit,
+                                   atc_level_param(params))
+        if ref is None:
+            return {"query": q, "reference": None, "counts": {}, "atc_levels": {}, "tiers": {}}
+        return {"query": q, "reference": engine.records([ref.name], FIELDS)[0],
+                "counts": {k: len(tiers[k]) for k in TIERS},
+                "atc_levels": {p: c for p, c in engine.atc_counts(ref.name).values()},
+                "tiers": {k: engine.records(tiers[k][:limit], FIELDS) for k in TIERS}}
+
+    def doses(self, params: dict) -> dict:
+        q = query_param(params)
+        tolerance = tolerance_param(params)
+        limit = limit_param(params, 50)
+        formes, statuts = params.get("forme", []), params.get("statut", [])
+        engine = self.live.get()
+        ref = engine.reference_position(q, formes, statuts)
+        if ref is None:
+            return {"query": q, "reference": None, "count": 0, "matches": []}
+        pos = engine.dose_positions(ref, tolerance, engine.selection(formes, statuts))
+        return {"query": q, "tolerance": tolerance, "reference": engine.records([ref], FIELDS)[0],
+                "count": len(pos), "matches": engine.records(pos[:limit], FIELDS)}
+
+    def molecules(self, params: dict) -> dict:
+        q = query_param(params)
+        limit = limit_param(params, 50)
+        engine = self.live.get()
+        try:
+            pos, terms = engine.molecule_query(q, params.get("forme", []), params.get("statut", []),
+                                               order_param(params), limit)
+        except ValueError as e:
+            raise ApiError(400, f"requête invalide : {e}") from None
+        return {"query": q, "terms": terms, "count": len(pos), "results": engine.records(pos[:limit], FIELDS)}
+
+    def run_route(self, path: str, params: dict, ticket: tuple | None = None) -> dict:
+        args = (params,) if ticket is None else (params, ticket)
+        if not metrics.ENABLED:
+            return self.routes[path](*args)
+        with metrics.Trace(f"api {path}"):
+            return self.routes[path](*args)
+
+    def arrive(self, params: dict) -> tuple | None:
+        """(session, numéro de la requête) pour une requête /suggest portant ``session``,
+        à l'arrivée (sur la boucle) : une requête plus récente la rendra obsolète."""
+        sid = param(params, "session")
+        if not sid: return None
+        session = self.sessions.pop(sid, None) or Session()
+        self.sessions[sid] = session
+        if len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+        session.latest += 1
+        return session, session.latest
+
+    # ---------------- HTTP ----------------
+    async def dispatch(self, method: str, target: str) -> tuple[int, dict]:
+        url = urlsplit(target)
+        if url.path == "/health":
+            if not self.live.ready:
+                status = self.live.status()
+                return 503, {"status": status.pop("state"), **status}
+            engine = self.live.engine  # sans get() : jamais de rechargement sur la boucle
+            return 200, {"status": "ok", "rows": engine.n, "fingerprint": engine.fingerprint,
+                         "warmup_seconds": self.live.status()["seconds"], "refresh_error": self.live.refresh_error,
+                         "pending": self.pending, "cache": engine.results.stats()}
+        if url.path not in self.routes:
+            return 404, {"error": f"route inconnue : {url.path}"}
+        if method != "GET":
+            return 405, {"error": "seul GET est accepté"}
+        if not self.live.ready and url.path != "/suggest":
+            return 503, {"error": "chargement en cours, réessayer plus tard", **self.live.status()}
+        if self.pending >= self.max_pending:
+            return 503, {"error": "trop de requêtes en attente, réessayer plus tard"}
+        params = parse_qs(url.query)
+        ticket = self.arrive(params) if url.path == "/suggest" else None
+        self.pending += 1
+        try:
+            async with self.slots:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.run_route, url.path, params, ticket)
+            return 200, result
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except Exception:
+            log.exception("échec de %s", target)
+            return 500, {"error": "erreur interne"}
+        finally:
+            self.pending -= 1
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Une connexion : requêtes HTTP/1.1 successives (keep-alive), corps ignorés."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                if int(headers.get("content-length") or 0):
+                    await reader.readexactly(int(headers["content-length"]))
+                if len(parts) != 3:
+                    status, payload, keep = 400, {"error": "ligne de requête invalide"}, False
+                else:
+                    status, payload = await self.dispatch(parts[0], parts[1])
+                    keep = parts[2] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                body = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(data_path: str, host: str, port: int, concurrency: int, max_pending: int) -> None:
+    live = LiveEngine(data_path).start()  # chargement en arrière-plan : on écoute tout de suite
+    api = SimilarityApi(live, concurrency, max_pending)
+    server = await asyncio.start_server(api.handle, host, port, backlog=1024)
+    print(f"medsim.api : http://{host}:{port} ({concurrency} threads, chargement de {data_path})",
+          file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.api",
+                                 description="API HTTP/JSON locale : suggestions, référence et similaires A–D.")
+    ap.add_argument("--data", default=DEFAULT_DATA, help=f"CSV de référence (défaut : {DEFAULT_DATA})")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--concurrency", type=int, default=8, help="recherches simultanées (threads, défaut : 8)")
+    ap.add_argument("--max-pending", type=int, default=256,
+                    help="requêtes en attente au-delà desquelles l'API répond 503 (défaut : 256)")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(serve(args.data, args.host, args.port, args.concurrency, args.max_pending))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
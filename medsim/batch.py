@@ -0,0 +1,140 @@
+# medsim/batch.py — similaires A–D pour tout un livret (CSV de requêtes), en parallèle
+#
+#   python -m medsim.batch livret.csv -o similaires.jsonl --data data_full_with_dr_luna.csv -j 8
+#
+# Les requêtes sont lues par paquets et réparties sur un pool de processus qui partagent
+# le jeu chargé (hérité par fork, sinon relu depuis le cache disque). Les résultats sont
+# écrits au fil de l'eau (JSONL ou CSV) ; la mémoire reste bornée à un paquet.
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+from itertools import islice
+from pathlib import Path
+
+from .engine import TIERS, SimilarityEngine
+
+DEFAULT_DATA = "data_full_with_dr_luna.csv"
+MAX_PER_TIER = 200  # même plafond que l'affichage
+ROW_FIELDS = ("specialite", "forme", "grammages", "statut", "atc_code", "detail_url")
+CSV_FIELDS = ("ligne", "requete", "reference", "tier", "rang") + ROW_FIELDS
+
+ENGINE = None  # moteur du processus courant (parent ou worker)
+
+def init_worker(data_path: str) -> None:
+    global ENGINE
+    if ENGINE is None:
+        ENGINE = SimilarityEngine.from_csv(data_path)
+
+def describe(pos: int) -> dict:
+    df = ENGINE.df
+    return {f: df.at[pos, f] for f in ROW_FIELDS}
+
+def similars_for(item: tuple[int, str], max_per_tier: int = MAX_PER_TIER) -> dict:
+    """Résultat d'une requête : référence trouvée et ses tiers A–D (données simples, picklables)."""
+    line, query = item
+    out = {"ligne": line, "requete": query, "reference": None}
+    pos = ENGINE.find_position(query.strip())
+    if pos is None:
+        return out
+    out["reference"] = describe(pos)
+    tiers = ENGINE.tier_positions(pos)
+    for k in TIERS:
+        out[k] = [describe(i) for i in tiers[k][:max_per_tier]]
+    return out
+
+def read_queries(path: str, column: str | None = None):
+    """(numéro de ligne, requête) pour chaque ligne non vide ; première colonne par défaut."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        col = column or (reader.fieldnames or [None])[0]
+        if col not in (reader.fieldnames or []):
+            raise ValueError(f"colonne introuvable : {col!r}")
+        for line, row in enumerate(reader, start=2):
+            q = (row.get(col) or "").strip()
+            if q:
+                yield line, q
+
+class ResultWriter:
+    """Écrit les résultats au fur et à mesure, en JSONL (un objet par requête) ou
+    en CSV (une ligne par produit similaire)."""
+
+    def __init__(self, path: str, fmt: str):
+        self.fmt = fmt
+        self.f = open(path, "w", newline="", encoding="utf-8")
+        if fmt == "csv":
+            self.w = csv.DictWriter(self.f, fieldnames=CSV_FIELDS)
+            self.w.writeheader()
+
+    def write(self, res: dict) -> None:
+        if self.fmt == "jsonl":
+            self.f.write(json.dumps(res, ensure_ascii=False) + "\n")
+            return
+        ref = res["reference"]
+        base = {"ligne": res["ligne"], "requete": res["requete"],
+                "reference": ref["specialite"] if ref else ""}
+        if ref is None:
+            self.w.writerow(base)
+            return
+        for k in TIERS:
+            for rank, r in enumerate(res[k], start=1):
+                self.w.writerow({**base, "tier": k, "rang": rank, **r})
+
+    def close(self) -> None:
+        self.f.close()
+
+def run_batch(queries_path: str, out_path: str, data_path: str = DEFAULT_DATA,
+              workers: int | None = None, column: str | None = None, fmt: str | None = None,
+              chunk: int = 2000, progress=None) -> int:
+    """Traite tout le fichier de requêtes ; renvoie le nombre de requêtes traitées.
+    ``progress(n)`` est appelé après chaque résultat écrit."""
+    global ENGINE
+    fmt = fmt or ("csv" if Path(out_path).suffix.lower() == ".csv" else "jsonl")
+    workers = workers or os.cpu_count() or 1
+    ENGINE = SimilarityEngine.from_csv(data_path)  # chargé avant le fork : partagé par les workers
+    queries = read_queries(queries_path, column)
+    writer = ResultWriter(out_path, fmt)
+    done = 0
+    try:
+        if workers == 1:
+            for res in map(similars_for, queries):
+                writer.write(res); done += 1
+                if progress: progress(done)
+            return done
+        with mp.Pool(workers, initializer=init_worker, initargs=(data_path,)) as pool:
+            while True:
+                batch = list(islice(queries, chunk))
+                if not batch:
+                    break
+                for res in pool.imap_unordered(similars_for, batch, chunksize=16):
+                    writer.write(res); done += 1
+                    if progress: progress(done)
+    finally:
+        writer.close()
+    return done
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.batch",
+                                 description="Similaires A–D pour chaque produit d'un fichier CSV.")
+    ap.add_argument("queries", help="CSV des requêtes (nom commercial ou DCI)")
+    ap.add_argument("-o", "--output", required=True, help="fichier de sortie (.jsonl ou .csv)")
+    ap.add_argument("--data", default=DEFAULT_DATA, help=f"CSV de référence (défaut : {DEFAULT_DATA})")
+    ap.add_argument("--column", help="colonne des requêtes (défaut : la première)")
+    ap.add_argument("--format", choices=("jsonl", "csv"), help="format de sortie (défaut : selon l'extension)")
+    ap.add_argument("-j", "--workers", type=int, help="nombre de processus (défaut : nombre de cœurs)")
+    args = ap.parse_args(argv)
+
+    def progress(n):
+        if n % 100 == 0:
+            print(f"\r{n} requêtes traitées", end="", file=sys.stderr, flush=True)
+
+    n = run_batch(args.queries, args.output, args.data, args.workers, args.column, args.format,
+                  progress=progress)
+    print(f"\r{n} requêtes traitées -> {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# medsim/bench.py — mesures de load_data, find_reference, group_similars et suggest
+#
+#   python -m medsim.bench                          # CSV livrés + synthétiques ×10 et ×100
+#   python -m medsim.bench --scales 10 100 1000 -o bench_output.txt
+#
+# Chaque jeu est mesuré dans un processus neuf (démarrage à froid, RSS de pointe isolé) :
+# chargement sans cache disque (froid) puis avec (chaud), puis latences par requête.
+# Une ligne JSON par jeu sur la sortie, pour comparer les runs dans le temps.
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SHIPPED = ("data_full.csv", "data_full_with_dr_luna.csv")
+SEED_CSV = "data_full.csv"
+QUERIES = 200
+
+def synthesize(df: pd.DataFrame, scale: int, seed: int = 0) -> pd.DataFrame:
+    """Catalogue ×scale : chaque copie permute le vocabulaire des molécules et les codes ATC
+    (même distribution des listes inversées) et suffixe les noms commerciaux et URL."""
+    rng = np.random.default_rng(seed)
+    mols = sorted({t.strip() for m in df["molecules"].fillna("") for t in m.split("|") if t.strip()})
+    atcs = sorted({a for a in df["atc_code"].fillna("") if a})
+    uniq_mols = df["molecules"].fillna("").unique()
+    parts = [df]
+    for j in range(1, scale):
+        mol_perm = dict(zip(mols, rng.permutation(mols)))
+        atc_perm = dict(zip(atcs, rng.permutation(atcs)))
+        remap = {m: " | ".join(mol_perm.get(t.strip(), t.strip()) for t in m.split("|") if t.strip())
+                 for m in uniq_mols}
+        c = df.copy()
+        c["specialite"] = c["specialite"] + f" S{j}"
+        c["molecules"] = c["molecules"].fillna("").map(remap)
+        c["atc_code"] = c["atc_code"].fillna("").map(lambda a: atc_perm.get(a, a))
+        c["detail_url"] = c["detail_url"] + f"#s{j}"
+        parts.append(c)
+    return pd.concat(parts, ignore_index=True)
+
+def make_queries(df: pd.DataFrame, n: int = QUERIES, seed: int = 1) -> list[str]:
+    """Mélange de requêtes réalistes : préfixes de noms, noms avec une faute, DCI."""
+    rnd = random.Random(seed)
+    brands = df["specialite"].dropna().tolist()
+    dcis = [m for m in df["molecules"].dropna().tolist() if m]
+    out = []
+    for k in range(n):
+        s = rnd.choice(brands if k % 3 else dcis)
+        if k % 3 == 1:
+            s = s[:rnd.randint(3, max(3, len(s)))]
+        elif k % 3 == 2 and len(s) > 4:
+            i = rnd.randrange(len(s)); s = s[:i] + s[i + 1:]
+        out.append(s)
+    return out
+
+def percentiles(samples: list[float]) -> dict:
+    a = np.asarray(samples) * 1000
+    return {"n": len(a), "mean_ms": round(float(a.mean()), 3),
+            "p50_ms": round(float(np.percentile(a, 50)), 3),
+            "p90_ms": round(float(np.percentile(a, 90)), 3),
+            "p99_ms": round(float(np.percentile(a, 99)), 3)}
+
+def bench_dataset(name: str, csv_path: str, queries: list[str]) -> dict:
+    """Exécuté dans un processus neuf : mesures d'un jeu de données."""
+    from .cache import cache_path
+    from .engine import SimilarityEngine, load_data
+
+    cache_path(csv_path).unlink(missing_ok=True)
+    t = time.perf_counter(); load_data(csv_path, use_cache=False); cold = time.perf_counter() - t
+    load_data(csv_path)  # écrit le cache disque
+    t = time.perf_counter(); df, index = load_data(csv_path); warm = time.perf_counter() - t
+    engine = SimilarityEngine(df, index)
+
+    stages = {"find_reference": [], "group_similars": [], "suggest": []}
+    for q in queries:
+        t = time.perf_counter(); pos = engine.find_position(q); stages["find_reference"].append(time.perf_counter() - t)
+        if pos is not None:
+            t = time.perf_counter(); engine.tier_positions(pos); stages["group_similars"].append(time.perf_counter() - t)
+        t = time.perf_counter(); engine.suggest_uncached(q); stages["suggest"].append(time.perf_counter() - t)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Ko sous Linux
+    mem = engine.memory_report()
+    return {"dataset": name, "rows": len(df), "load_cold_s": round(cold, 4), "load_warm_s": round(warm, 4),
+            "peak_rss_mb": round(peak_kb / 1024, 1), "frame_mb": mem["frame_mb"], "index_mb": mem["index_mb"],
+            "stages": {k: percentiles(v) for k, v in stages.items() if v}}
+
+def run(scales=(10, 100), shipped=SHIPPED, queries: int = QUERIES, workdir: str | None = None):
+    """Génère les jeux et renvoie une mesure (dict) par jeu, dans l'ordre."""
+    ctx = mp.get_context("spawn")
+    seed_df = pd.read_csv(SEED_CSV, dtype=str)
+    qs = make_queries(seed_df, queries)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        jobs = [(Path(p).name, p) for p in shipped if Path(p).exists()]
+        for k in scales:
+            path = Path(tmp) / f"synthetic_x{k}.csv"
+            synthesize(seed_df, k).to_csv(path, index=False)
+            jobs.append((f"{SEED_CSV}×{k}", str(path)))
+        for name, path in jobs:
+            with ctx.Pool(1) as pool:
+                yield pool.apply(bench_dataset, (name, path, qs))
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.bench",
+                                 description="Mesures des étapes du moteur sur les CSV livrés et des catalogues synthétiques.")
+    ap.add_argument("--scales", type=int, nargs="*", default=[10, 100],
+                    help="facteurs d'agrandissement de data_full.csv (défaut : 10 100)")
+    ap.add_argument("--queries", type=int, default=QUERIES, help=f"requêtes par jeu (défaut : {QUERIES})")
+    ap.add_argument("--no-shipped", action="store_true", help="ignorer les CSV livrés")
+    ap.add_argument("--workdir", help="répertoire des CSV synthétiques temporaires")
+    ap.add_argument("-o", "--output", help="fichier JSONL (défaut : sortie standard)")
+    args = ap.parse_args(argv)
+
+    meta = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "pandas": pd.__version__, "machine": platform.machine()}
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for res in run(args.scales, () if args.no_shipped else SHIPPED, args.queries, args.workdir):
+            out.write(json.dumps({**meta, **res}, ensure_ascii=False) + "\n"); out.flush()
+            fr, gs = res["stages"]["find_reference"], res["stages"].get("group_similars", {})
+            print(f"{res['dataset']:<32} {res['rows']:>9} lignes  froid {res['load_cold_s']:>7.2f}s  "
+                  f"chaud {res['load_warm_s']:>6.2f}s  RSS {res['peak_rss_mb']:>7.1f} Mo "
+                  f"(données {res['frame_mb']:.1f} + index {res['index_mb']:.1f})  "
+                  f"find p50/p99 {fr['p50_ms']:.2f}/{fr['p99_ms']:.2f} ms  "
+                  f"tiers p50/p99 {gs.get('p50_ms', 0):.2f}/{gs.get('p99_ms', 0):.2f} ms",
+                  file=sys.stderr)
+    finally:
+        if out is not sys.stdout: out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# medsim/cache.py — cache disque du jeu normalisé et de son index, indexé par l'empreinte du CSV
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .metrics import count
+
+CACHE_VERSION = 9  # à incrémenter dès que la normalisation ou build_index changent
+
+def cache_path(csv_path: str) -> Path:
+    p = Path(csv_path)
+    return p.parent / ".cache" / f"{p.name}.pkl"
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def read_cache(csv_path: str):
+    """(df, index, sha1 courant du CSV, stat du CSV pris avant ce sha1) depuis le cache, ou
+    None (absent, autre version du format, illisible). L'en-tête (version, taille, mtime, sha1)
+    est lu avant le corps ; le CSV n'est haché que si sa taille ou son mtime ont changé. Un cache d'une version antérieure
+    du CSV (base d'un rechargement incrémental) est aussi renvoyé : son sha1 diffère alors
+    du courant, et son index garde l'empreinte de cette version."""
+    path = cache_path(csv_path)
+    if not path.exists():
+        return None
+    info = Path(csv_path).stat()
+    try:
+        with open(path, "rb") as f:
+            head = pickle.load(f)
+            if head.get("version") != CACHE_VERSION:
+                return None
+            same_stat = (head.get("size"), head.get("mtime_ns")) == (info.st_size, info.st_mtime_ns)
+            sha1 = head.get("sha1") if same_stat else file_sha1(csv_path)
+            df, index = pickle.load(f)
+    except Exception:
+        return None  # cache corrompu ou illisible : reconstruit par l'appelant
+    if not same_stat and sha1 == head.get("sha1"):
+        write_cache(csv_path, df, index, sha1, info)  # contenu identique, seul le mtime a bougé
+    return df, index, sha1, info
+
+def write_cache(csv_path: str, df, index: dict, sha1: str, info: os.stat_result) -> None:
+    """``sha1`` : empreinte du CSV dont proviennent df et index ; ``info`` : son stat, pris par
+    l'appelant avant le hachage. Un CSV réécrit entre-temps a donc un autre mtime que l'en-tête,
+    et sera rehaché au prochain chargement au lieu d'être pris pour celui du cache."""
+    path = cache_path(csv_path)
+    head = {"version": CACHE_VERSION, "size": info.st_size, "mtime_ns": info.st_mtime_ns, "sha1": sha1}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(head, f, protocol=5)
+            pickle.dump((df, index), f, protocol=5)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # disque en lecture seule : on se passe du cache
+
+# ---------------- FICHIERS IMPORTÉS ----------------
+UPLOADS_KEPT = 4  # fichiers importés conservés sur disque (avec leur cache), les plus récents
+
+def store_upload(fileobj, directory: str) -> Path:
+    """Copie un fichier importé (objet binaire lisible) sous ``<directory>/<sha1>.csv`` par
+    blocs, en calculant l'empreinte au passage, et renvoie ce chemin. Un contenu déjà reçu
+    garde son fichier, donc son cache disque ; au-delà de UPLOADS_KEPT, les plus anciens
+    sont supprimés."""
+    folder = Path(directory)
+    folder.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha1()
+    tmp = folder / f".upload.{os.getpid()}.{threading.get_ident()}.tmp"
+    fileobj.seek(0)
+    with open(tmp, "wb") as f:
+        for chunk in iter(lambda: fileobj.read(1 << 20), b""):
+            h.update(chunk)
+            f.write(chunk)
+    path = folder / f"{h.hexdigest()}.csv"
+    if path.exists():
+        tmp.unlink()  # mtime inchangé : le cache disque reste valide sans rehachage
+    else:
+        os.replace(tmp, path)
+    others = sorted((p for p in folder.glob("*.csv") if p != path), key=lambda p: p.stat().st_mtime_ns)
+    for old in others[:max(0, len(others) - (UPLOADS_KEPT - 1))]:
+        old.unlink(missing_ok=True)
+        cache_path(old).unlink(missing_ok=True)
+    return path
+
+# ---------------- CACHE DE RÉSULTATS ----------------
+class ResultCache:
+    """Cache LRU borné, partagé par toutes les sessions du processus (thread-safe).
+
+    Les clés contiennent l'empreinte du jeu de données : un nouveau CSV ne relit
+    jamais les résultats de l'ancien, qui sortent du cache par éviction LRU.
+    Les valeurs sont partagées : les appelants ne doivent pas les modifier.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.data:
+                self.hits += 1
+                self.data.move_to_end(key)
+                count("cache_hits")
+                return self.data[key]
+            self.misses += 1
+        count("cache_misses")
+        value = compute()  # hors verrou : deux sessions peuvent calculer la même clé
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self.data), "maxsize": self.maxsize}
+
+RESULTS = ResultCache()  # cache partagé par défaut des moteurs du processus
@@ -0,0 +1,87 @@
+# medsim/columns.py — normalisation de colonnes entières (pandas), mêmes résultats que medsim.normalize
+#
+# Chaque colonne est factorisée : une valeur distincte n'est normalisée qu'une fois, par
+# les méthodes .str de pandas, puis le résultat est redistribué par code (les lignes de même
+# valeur partagent la même chaîne). Vérification sur les CSV livrés :
+#
+#   python -m medsim.columns data_full.csv data_full_with_dr_luna.csv
+
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from .normalize import (FORME_MAX_LEN, FORME_REPLACEMENTS, FORME_RULES, norm_forme,
+                        norm_pipes_lower, strip_accents)
+
+def by_value(col, transform) -> np.ndarray:
+    """transform(Series des valeurs distinctes de col) redistribué sur les lignes de col."""
+    codes, uniques = pd.factorize(np.asarray(col, dtype=object))
+    if not len(uniques):
+        return np.full(len(codes), "", dtype=object)
+    out = np.asarray(transform(pd.Series(uniques, dtype=object)), dtype=object)
+    return out[codes]
+
+def mark_table(s: pd.Series) -> dict:
+    """Table str.translate supprimant les marques combinantes (Mn) présentes dans s."""
+    return {ord(c): None for c in set("".join(s)) if unicodedata.category(c) == "Mn"}
+
+def strip_accents_col(u: pd.Series) -> pd.Series:
+    nfd = u.str.normalize("NFD")
+    return nfd.str.translate(mark_table(nfd))
+
+def lower_key_col(u: pd.Series) -> pd.Series:
+    """strip_accents(v).lower() (clés de nom commercial et d'autocomplétion)."""
+    return strip_accents_col(u).str.lower()
+
+def norm_forme_col(u: pd.Series) -> pd.Series:
+    s = strip_accents_col(u.astype(str)).str.lower().str.strip()
+    for old, new in FORME_REPLACEMENTS:
+        s = s.str.replace(old, new, regex=False)
+    out = s.str.upper().str[:FORME_MAX_LEN]
+    for needle, label in reversed(FORME_RULES):  # la première règle qui correspond l'emporte
+        out = out.mask(s.str.contains(needle, regex=False), label)
+    return out
+
+def norm_pipes_col(u: pd.Series) -> pd.Series:
+    """norm_pipes_lower : « / » et virgules (sans |) comme séparateurs, parties sans accents."""
+    x = u.str.replace(" / ", " | ", regex=False).str.replace("/", " / ", regex=False)
+    commas = ~x.str.contains("|", regex=False) & x.str.contains(",", regex=False)
+    x = x.mask(commas, x.str.replace(",", "|", regex=False))
+    parts = x.str.split("|").explode()
+    parts = parts[parts.str.strip() != ""]
+    parts = lower_key_col(parts).str.strip()
+    return parts.groupby(level=0).agg(" | ".join).reindex(u.index, fill_value="")
+
+# colonne normalisée -> (colonne source, version colonne, version scalaire de référence)
+NORMALIZED = {
+    "molecules_norm": ("molecules", norm_pipes_col, norm_pipes_lower),
+    "forme_norm":     ("forme", norm_forme_col, norm_forme),
+    "grammages_norm": ("grammages", norm_pipes_col, norm_pipes_lower),
+    "brand_key":      ("specialite", lower_key_col, lambda s: strip_accents(s).lower()),
+}
+
+# cas limites ajoutés aux CSV vérifiés : séparateurs, marques combinantes, casse spéciale
+EDGE_CASES = ["", "  ", " | ", "a/b", "a / b/c", "A , B", "x,,y", "x, |y", "É\u0301té", "İstanbul",
+              "ﬁbre", "Ǆ", "Comp. pelliculé", "cp sécable", "Gélule|Sirop", "\u0301", "ÅNGSTRÖM"]
+
+def check(paths) -> int:
+    """Compare chaque version colonne à la fonction scalaire sur les CSV ; nombre d'écarts."""
+    bad = 0
+    frames = [(p, pd.read_csv(p, dtype=str).fillna("")) for p in paths]
+    frames.append(("cas limites", pd.DataFrame({c: EDGE_CASES for c in ("molecules", "forme", "grammages", "specialite")})))
+    for path, df in frames:
+        cols = {c: df[c] if c in df.columns else pd.Series("", index=df.index)
+                for c in {src for src, _, _ in NORMALIZED.values()}}
+        for name, (src, vec, scalar) in NORMALIZED.items():
+            got, exp = by_value(cols[src], vec), cols[src].map(scalar).to_numpy()
+            diff = np.flatnonzero(got != exp)
+            bad += len(diff)
+            print(f"{path}: {name:<15} {len(df) - len(diff)}/{len(df)} identiques", file=sys.stderr)
+            for i in diff[:5]:
+                print(f"    {cols[src].iat[i]!r}: {got[i]!r} != {exp[i]!r}", file=sys.stderr)
+    return bad
+
+if __name__ == "__main__":
+    sys.exit(1 if check(sys.argv[1:] or ["data_full.csv", "data_full_with_dr_luna.csv"]) else 0)
@@ -0,0 +1,46 @@
+# medsim/dosage.py — dosages en valeurs numériques et unités canoniques (bibliothèque standard)
+#
+#   parse_strength("100 µg")        -> (0.1, "mg")
+#   canonical_doses("1 g | 125 mg") -> frozenset({"1000 mg", "125 mg"})
+#
+# Masses en mg, volumes en ml, unités internationales en UI, pourcentages en %. Une partie
+# non reconnue (« extrait sec de melisse 200 mg », « dose »…) reste telle quelle : elle ne
+# correspond qu'à elle-même.
+
+import re
+
+from .normalize import split_set_norm
+
+# unité lue (après normalisation : minuscules, sans accents) -> (unité canonique, facteur)
+UNITS = {
+    "mg": ("mg", 1.0), "g": ("mg", 1000.0), "kg": ("mg", 1e6),
+    "µg": ("mg", 1e-3), "μg": ("mg", 1e-3), "mcg": ("mg", 1e-3), "ug": ("mg", 1e-3),
+    "microgramme": ("mg", 1e-3), "microgrammes": ("mg", 1e-3), "ng": ("mg", 1e-6),
+    "ml": ("ml", 1.0), "l": ("ml", 1000.0),
+    "ui": ("ui", 1.0), "u": ("ui", 1.0), "unite": ("ui", 1.0), "unites": ("ui", 1.0),
+    "kui": ("ui", 1e3), "mui": ("ui", 1e6), "mu": ("ui", 1e6),
+    "%": ("%", 1.0), "mmol": ("mmol", 1.0),
+}
+STRENGTH = re.compile(r"(?:(\d[\d ]*(?:[.,]\d+)?)\s*)?([^\d\s.,]+)?[\s,]*")
+
+def parse_strength(token: str):
+    """(valeur, unité canonique) d'une partie de dosage, ou None si non reconnue.
+    Nombre seul : unité "" ; unité seule (« ml » de « 20 mg / ml ») : valeur 1."""
+    m = STRENGTH.fullmatch(token.strip())
+    if m is None or not (m.group(1) or m.group(2)):
+        return None
+    unit, factor = ("", 1.0) if m.group(2) is None else UNITS.get(m.group(2), (None, 0.0))
+    if unit is None:
+        return None
+    value = float(m.group(1).replace(" ", "").replace(",", ".")) if m.group(1) else 1.0
+    return value * factor, unit
+
+def canonical_token(token: str) -> str:
+    """« 100 µg » -> « 0.1 mg » ; une partie non reconnue est renvoyée telle quelle."""
+    s = parse_strength(token)
+    return token if s is None else f"{s[0]:.9g} {s[1]}".rstrip()
+
+def canonical_doses(grammages_norm: str) -> frozenset:
+    """Ensemble des parties d'un dosage normalisé, en unités canoniques : deux dosages
+    équivalents (« 1000 mg » et « 1 g ») donnent le même ensemble."""
+    return frozenset(canonical_token(t) for t in split_set_norm(grammages_norm))
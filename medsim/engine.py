@@ -0,0 +1,643 @@
+# medsim/engine.py — moteur de similarité réutilisable (apps Streamlit, traitements par lot)
+
+import hashlib
+import os
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .cache import RESULTS, ResultCache, file_sha1, read_cache, store_upload, write_cache
+from .columns import NORMALIZED, by_value
+from .index import (atc_level_counts, atc_neighbours, build_index, containing_all, contains_array,
+                    contains_candidates, fuzzy_candidates, match_rows, merge_indexes, mol_key, patch_index,
+                    prefix_bounds, prefix_entries, within_strength)
+from .metrics import count, memory_report, timed
+from .normalize import strip_accents
+from .prices import numeric_column, pack_quantity_col, price_col
+from .query import evaluate, parse, resolve
+
+EXPECTED_COLUMNS = {
+    "specialite", "molecules", "grammages", "forme", "statut",
+    "classe_therapeutique", "atc_code", "presentation",
+    "composition_pretty", "dosage_pretty", "presentation_pretty",
+    "detail_url", "labo", "ppv_value", "prix_hospitalier",
+}
+TIERS = ("A", "B", "C", "D")
+# ordres des tiers : commercialisés d'abord, puis nom, prix public ou prix par unité (puis nom)
+RANKINGS = ("statut", "prix", "prix_unitaire")
+FUZZY_MIN_SCORE = 75
+CHUNK_ROWS = 50_000  # lignes par paquet (découpage en partitions, fusion de sources)
+CATEGORY_MAX_RATIO = 0.5  # colonne catégorielle si valeurs distinctes <= 50 % des lignes
+
+def read_csv(source) -> pd.DataFrame:
+    """CSV brut (chemin ou fichier) limité aux EXPECTED_COLUMNS : les autres colonnes (dates
+    de collecte, notices…) ne sont jamais matérialisées. Lu d'un bloc : des paquets réunis par
+    concat garderaient deux copies du jeu au moment de l'assemblage."""
+    return pd.read_csv(source, dtype=str, usecols=lambda c: c in EXPECTED_COLUMNS)
+
+def prepare_frame(df: pd.DataFrame, reuse: tuple | None = None) -> pd.DataFrame:
+    """Complète les colonnes attendues et ajoute les clés normalisées.
+    ``reuse`` = (ancien df normalisé, old_pos de match_rows) : les lignes appariées
+    reprennent leurs clés au lieu d'être renormalisées."""
+    df = df.fillna("").reset_index(drop=True)
+    for m in EXPECTED_COLUMNS:
+        if m not in df.columns: df[m] = ""
+    for col, (src, vec, _) in NORMALIZED.items():
+        if reuse is None or not len(reuse[0]):
+            df[col] = by_value(df[src], vec)
+            continue
+        old, old_pos = reuse
+        vals = old[col].to_numpy()[np.maximum(old_pos, 0)]
+        todo = np.flatnonzero(old_pos < 0)
+        if len(todo):
+            vals[todo] = by_value(df[src].to_numpy()[todo], vec)
+        df[col] = vals
+    return compact_frame(df)
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Colonnes répétitives (forme, labo, statut, ATC, DCI…) en catégories : un code entier
+    par ligne et chaque libellé stocké une fois. Les valeurs lues restent des str.
+    Un jeu vide reste en object (catégories vides)."""
+    if not len(df):
+        return df
+    for c in df.columns:
+        if df[c].dtype == object and df[c].nunique() <= CATEGORY_MAX_RATIO * len(df):
+            df[c] = df[c].astype("category")
+    return df
+
+@timed("load")
+def load_data(csv_path: str, use_cache: bool = True, on_frame=None) -> tuple[pd.DataFrame, dict]:
+    """Jeu normalisé + index ; passe par le cache disque quand il est à jour, et par un
+    rechargement incrémental quand le cache date d'une version antérieure du CSV.
+    ``on_frame(df)`` : appelé avec un jeu normalisé (éventuellement l'ancien) avant l'indexation."""
+    if not Path(csv_path).exists():
+        raise FileNotFoundError(csv_path)
+    if use_cache:
+        cached = read_cache(csv_path)
+        if cached is not None:
+            df, index, sha1, info = cached
+            if index.get("fingerprint") == sha1:
+                return df, index
+            if on_frame: on_frame(df)
+            return refresh_data(csv_path, df, index, sha1=sha1, info=info)
+    info, sha1 = Path(csv_path).stat(), file_sha1(csv_path)  # stat avant hachage et lecture
+    df = prepare_frame(read_csv(csv_path))
+    if on_frame: on_frame(df)
+    index = build_index(df)
+    index["fingerprint"] = sha1
+    if use_cache:
+        write_cache(csv_path, df, index, sha1, info)
+    return df, index
+
+@timed("refresh")
+def refresh_data(csv_path: str, df: pd.DataFrame, index: dict,
+                 use_cache: bool = True, sha1: str | None = None,
+                 info: os.stat_result | None = None) -> tuple[pd.DataFrame, dict]:
+    """Nouvelle version du CSV à partir du jeu déjà chargé : les lignes sont appariées par
+    detail_url, seules les ajoutées ou modifiées sont renormalisées et redécoupées, et
+    l'index est recomposé à partir de l'ancien. Même résultat qu'un chargement complet.
+    ``sha1``, ``info`` : empreinte courante du CSV et stat pris avant elle, si l'appelant
+    les a déjà."""
+    if sha1 is None or info is None:
+        info, sha1 = Path(csv_path).stat(), file_sha1(csv_path)
+    if index.get("fingerprint") == sha1:
+        return df, index
+    raw = read_csv(csv_path)
+    old_pos = match_rows(raw, df, index)
+    count("rows_renormalized", int((old_pos < 0).sum()))
+    new_df = prepare_frame(raw, reuse=(df, old_pos))
+    new_index = patch_index(index, new_df, old_pos)
+    new_index["fingerprint"] = sha1
+    if use_cache:
+        write_cache(csv_path, new_df, new_index, sha1, info)
+    return new_df, new_index
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Empreinte du contenu d'un DataFrame (fichier importé, jeu construit en mémoire)."""
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+@lru_cache(maxsize=1)
+def load_rapidfuzz():
+    """(process, fuzz) de rapidfuzz, ou None : importé au premier fuzzy seulement."""
+    try:
+        from rapidfuzz import process, fuzz
+        return process, fuzz
+    except Exception:
+        return None
+
+def best_fuzzy(query: str, choices: list):
+    """(rang, score, accepté) du meilleur choix ; cdist en lot si rapidfuzz est là,
+    sinon difflib dont le meilleur choix est toujours accepté."""
+    rf = load_rapidfuzz()
+    if rf is not None:
+        process, fuzz = rf
+        scores = process.cdist([query], choices, scorer=fuzz.WRatio)[0]
+        k = int(scores.argmax())
+        return k, float(scores[k]), scores[k] >= FUZZY_MIN_SCORE
+    import difflib
+    match = difflib.get_close_matches(query, choices, n=1, cutoff=0)
+    if not match:
+        return None, 0.0, False
+    return choices.index(match[0]), 100.0, True
+
+def query_key(q: str) -> str:
+    """Requête telle que recherchée et mise en cache : espaces normalisés, casse conservée (le
+    fuzzy y est sensible). Les méthodes mises en cache calculent sur cette forme, pas sur la
+    saisie brute : deux saisies qui partagent une entrée du cache donnent le même résultat."""
+    return " ".join(q.split())
+
+class SuggestState:
+    """Autocomplétion d'une session (onglet, client de l'API) : plage de préfixe et candidats
+    « contient » de la dernière saisie. Tant que la saisie se prolonge, la suivante est cherchée
+    dans ces candidats ; après un effacement ou une édition, on repart de l'index complet."""
+
+    __slots__ = ("fingerprint", "qn", "lo", "hi", "cand", "cand_qn")
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, fingerprint) -> None:
+        self.fingerprint = fingerprint
+        self.qn, self.lo, self.hi = "", 0, None
+        self.cand, self.cand_qn = None, ""
+
+class SimilarityEngine:
+    """Données normalisées + index, et les lectures utilisées par l'interface.
+
+    Les positions de lignes sont les libellés de ``df`` (RangeIndex). Les filtres
+    ``formes`` (valeurs de ``forme_norm``) et ``statuts`` restreignent les lignes
+    considérées ; vides, ils ne filtrent rien. En interne, la restriction circule
+    sous forme de masque booléen par position (``in_view``). ``suggest`` et ``search`` passent par
+    un cache de résultats partagé, indexé par requête, filtres et empreinte du jeu.
+    """
+
+    def __init__(self, df: pd.DataFrame, index: dict | None = None, results: ResultCache = RESULTS):
+        self.df = df
+        self.index = index if index is not None else build_index(df)
+        self.fingerprint = self.index.get("fingerprint") or frame_fingerprint(df)
+        self.results = results
+        self.n = len(df)
+        self.specialite = df["specialite"].tolist()
+        self.detail_url = df["detail_url"].tolist()
+        self.forme_norm = df["forme_norm"].tolist()
+        self.statut = df["statut"].astype(str).tolist()
+        self.atc_code = [(a or "").strip() for a in df["atc_code"].tolist()]
+        self.commercial = np.fromiter((s.lower().startswith("com") for s in self.statut), dtype=bool, count=self.n)
+        # prix en float (nan si absent), convertis une fois par valeur distincte
+        self.price = numeric_column(df["ppv_value"], price_col)
+        self.unit_price = self.price / numeric_column(df["presentation"], pack_quantity_col)
+        self.ranks = {}  # ordre -> rang global de chaque ligne, calculé au premier usage
+        self.mol_names = None  # vocabulaire trié des molécules, au premier molecule_query
+        self.columns = {}  # colonne -> liste de str, construite au premier records()
+        self.formes = sorted({f for f in self.forme_norm if f})
+        self.statuts = sorted({s for s in self.statut if s})
+        # codes catégoriels des colonnes filtrables : un filtre = une table de booléens par code
+        self.filter_codes = {}
+        for col, values in (("forme_norm", self.forme_norm), ("statut", self.statut)):
+            codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+            self.filter_codes[col] = (codes, {v: c for c, v in enumerate(uniques)})
+
+    @classmethod
+    def from_csv(cls, csv_path: str, use_cache: bool = True) -> "SimilarityEngine":
+        return cls(*load_data(csv_path, use_cache=use_cache))
+
+    def refreshed(self, csv_path: str, use_cache: bool = True) -> "SimilarityEngine":
+        """Moteur de la version courante du CSV, construit de façon incrémentale à partir
+        de celui-ci (qui reste utilisable tel quel) ; lui-même si le contenu n'a pas changé."""
+        df, index = refresh_data(csv_path, self.df, self.index, use_cache)
+        return self if index is self.index else type(self)(df, index, self.results)
+
+    @classmethod
+    def combine(cls, engines: list, results: ResultCache = RESULTS) -> "SimilarityEngine":
+        """Moteur sur la réunion de plusieurs jeux déjà indexés (partitions), dans l'ordre
+        donné : les index sont fusionnés, rien n'est renormalisé ni redécoupé."""
+        if len(engines) == 1:
+            return engines[0]
+        df = compact_frame(pd.concat([e.df for e in engines], ignore_index=True))
+        index = merge_indexes(df, [e.index for e in engines])
+        index["fingerprint"] = hashlib.sha1(" ".join(e.fingerprint for e in engines).encode()).hexdigest()
+        return cls(df, index, results)
+
+    @classmethod
+    def from_upload(cls, fileobj, directory: str = ".cache/uploads") -> "SimilarityEngine":
+        """Depuis un fichier importé : stocké sous son empreinte puis chargé comme un CSV
+        du dépôt (colonnes attendues seules, cache disque) ; un même contenu n'est indexé qu'une fois."""
+        return cls.from_csv(str(store_upload(fileobj, directory)))
+
+    @timed("filter")
+    def selection(self, formes=(), statuts=()):
+        """Masque booléen des positions retenues par les filtres, ou None si aucun filtre.
+        Les valeurs choisies sont marquées dans une table indexée par code : pas de isin
+        ni de copie du DataFrame, quel que soit le nombre de colonnes."""
+        if not formes and not statuts: return None
+        mask = np.ones(self.n, dtype=bool)
+        for col, wanted in (("forme_norm", formes), ("statut", statuts)):
+            if not wanted: continue
+            codes, code_of = self.filter_codes[col]
+            table = np.zeros(len(code_of), dtype=bool)
+            table[[code_of[v] for v in wanted if v in code_of]] = True
+            mask &= table[codes]
+        return mask
+
+    @timed("rows")
+    def rows(self, positions) -> list[pd.Series]:
+        return [r for _, r in self.df.loc[list(positions)].iterrows()]
+
+    def records(self, positions, fields) -> list[dict]:
+        """Lignes en dictionnaires {colonne: str} sans passer par pandas (API, JSON)."""
+        cols = [self.column(f) for f in fields]
+        return [{f: c[i] for f, c in zip(fields, cols)} for i in positions]
+
+    def column(self, name: str) -> list[str]:
+        col = self.columns.get(name)
+        if col is None:
+            col = self.columns[name] = self.df[name].astype(str).tolist()
+        return col
+
+    def memory_report(self) -> dict:
+        """Mo par colonne et par structure d'index (voir metrics.memory_report)."""
+        return memory_report(self.df, self.index)
+
+    def cache_key(self, kind: str, q: str, formes, statuts, *extra) -> tuple:
+        return (kind, self.fingerprint, query_key(q), frozenset(formes), frozenset(statuts)) + extra
+
+    # ---------------- AUTOCOMPLÉTION ----------------
+    def suggest(self, q: str, formes=(), statuts=(), max_suggestions: int = 8,
+                state: "SuggestState | None" = None) -> list[str]:
+        q = query_key(q)
+        key = self.cache_key("suggest", q, formes, statuts, max_suggestions)
+        return self.results.get_or_compute(
+            key, lambda: self.suggest_uncached(q, self.selection(formes, statuts), max_suggestions, state))
+
+    @timed("suggest")
+    def suggest_uncached(self, q: str, in_view=None, max_suggestions: int = 8,
+                         state: "SuggestState | None" = None) -> list[str]:
+        """Noms puis DCI commençant par la saisie, puis la contenant. ``state`` : candidats de
+        la saisie précédente de la session, affinés au lieu d'être recalculés (voir SuggestState)."""
+        qn = strip_accents(q).lower().strip()
+        if not qn: return []
+        sx = self.index["suggest"]
+        if state is not None and state.fingerprint != self.fingerprint:
+            state.reset(self.fingerprint)
+        n, combos, keys = sx["n"], sx["combos"], sx["keys"]
+        seen, out = set(), []
+        def take(entries, contains=False):
+            for o in entries:
+                val = combos[o]
+                if val in seen or (in_view is not None and not in_view[o % n]): continue
+                if contains and qn not in keys[o]: continue
+                out.append(val); seen.add(val)
+                if len(out)>=max_suggestions: return True
+            return False
+        # 1) préfixe : plage contiguë du tableau trié (dans celle de la saisie précédente si
+        #    elle la prolonge), remise dans l'ordre d'affichage
+        narrow = state is not None and state.qn and qn.startswith(state.qn)
+        lo, hi = prefix_bounds(sx, qn, state.lo, state.hi) if narrow else prefix_bounds(sx, qn)
+        if state is not None:
+            state.qn, state.lo, state.hi = qn, lo, hi
+        if take(np.sort(sx["order"][lo:hi]).tolist()): return out
+        # 2) contient : candidats partageant tous les trigrammes de la requête ; ceux d'une saisie
+        #    précédente contenue dans celle-ci ne sont intersectés qu'avec les nouveaux trigrammes
+        within = state.cand if state is not None and state.cand is not None and state.cand_qn in qn else None
+        cand = contains_array(sx, qn, within, state.cand_qn if within is not None else "")
+        if state is not None:
+            state.cand, state.cand_qn = cand, qn
+        take(range(len(keys)) if cand is None else cand.tolist(), contains=True)
+        return out[:max_suggestions]
+
+    # ---------------- RECHERCHE COMPLÈTE ----------------
+    def search(self, query: str, formes=(), statuts=(), order: str = "statut",
+               top: int | None = None, atc_level: int = 5) -> tuple[pd.Series | None, dict]:
+        """(référence, positions classées de chaque tier A–D) ; servi depuis le cache sans
+        toucher au DataFrame si déjà vu. Les lignes s'obtiennent page par page via ``rows``.
+        Le cache garde les tiers complets, non classés : ``order`` et ``top`` (voir ranked) sont
+        appliqués à la lecture, une page de plus ne relance ni la référence ni les tiers.
+        ``atc_level`` : voir tier_positions."""
+        self.rank_of(order)  # ordre inconnu : ValueError avant toute mise en cache
+        query = query_key(query)
+        def compute():
+            pos = self.reference_position(query, formes, statuts)  # partagée avec /reference, /doses
+            if pos is None:
+                return None, {}
+            return self.df.loc[pos], self.tier_members(pos, self.selection(formes, statuts), atc_level=atc_level)
+        ref, members = self.results.get_or_compute(self.cache_key("search", query, formes, statuts, atc_level), compute)
+        return ref, {k: self.ranked(v, order, top) for k, v in members.items()}
+
+    # ---------------- RÉFÉRENCE ----------------
+    @timed("find_reference")
+    def find_position(self, query: str, in_view=None) -> int | None:
+        """Position de la référence : préfixe du nom, puis fuzzy (noms puis DCI), puis « contient »."""
+        if not query: return None
+        qn = strip_accents(query).lower().strip()
+        sx = self.index["suggest"]
+        n, keys = sx["n"], sx["keys"]
+        visible = lambda o: in_view is None or in_view[o % n]
+        sw = [o for o in prefix_entries(sx, qn) if o < n and visible(o)]
+        if sw:
+            return min(sw)
+        for start in (0, n):
+            cand = fuzzy_candidates(sx, qn, start, start + n, in_view)
+            if not cand: continue
+            count("candidates_scored", len(cand))
+            k, _, ok = best_fuzzy(query, [sx["combos"][o] for o in cand])
+            if ok:
+                return cand[k] % n
+        for o in contains_candidates(sx, qn):
+            if o >= n: break
+            if qn in keys[o] and visible(o): return o
+        return None
+
+    def reference_position(self, query: str, formes=(), statuts=()) -> int | None:
+        """Position de la référence seule (sans les tiers), mise en cache."""
+        query = query_key(query)
+        return self.results.get_or_compute(self.cache_key("reference", query, formes, statuts),
+                                           lambda: self.find_position(query, self.selection(formes, statuts)))
+
+    def find_reference(self, query: str, formes=(), statuts=()) -> pd.Series | None:
+        pos = self.find_position(query, self.selection(formes, statuts))
+        return None if pos is None else self.df.loc[pos]
+
+    # ---------------- CLASSEMENT ----------------
+    def rank_of(self, order: str) -> np.ndarray:
+        """Rang de chaque ligne dans l'ordre ``order`` (RANKINGS) sur tout le jeu : commercialisés
+        d'abord, puis prix (absents en dernier) et nom, puis position. Un tri par ordre et par moteur."""
+        rank = self.ranks.get(order)
+        if rank is None:
+            if order not in RANKINGS:
+                raise ValueError(f"ordre inconnu : {order!r} (attendu : {', '.join(RANKINGS)})")
+            names, _ = pd.factorize(np.asarray(self.specialite, dtype=object), sort=True)
+            keys = {"statut": (names,), "prix": (names, self.price), "prix_unitaire": (names, self.unit_price)}[order]
+            perm = np.lexsort(keys + (~self.commercial,))  # stable : à égalité, la position
+            rank = np.empty(self.n, dtype=np.int64)
+            rank[perm] = np.arange(self.n)
+            self.ranks[order] = rank
+        return rank
+
+    def ranked(self, positions, order: str = "statut", top: int | None = None) -> list:
+        """Positions dans l'ordre ``order``. Avec ``top``, seules les ``top`` premières sont
+        sélectionnées (argpartition) et triées ; les suivantes gardent l'ordre reçu."""
+        pos = np.asarray(positions, dtype=np.int64)
+        r = self.rank_of(order)[pos]
+        if top is None or top >= len(pos):
+            return pos[np.argsort(r)].tolist()
+        if top <= 0:
+            return pos.tolist()
+        head = np.argpartition(r, top - 1)[:top]
+        head = head[np.argsort(r[head])]
+        tail = np.ones(len(pos), dtype=bool)
+        tail[head] = False
+        return pos[head].tolist() + pos[tail].tolist()
+
+    # ---------------- TIERS A–D ----------------
+    def tier_positions(self, ref_pos: int, in_view=None, subset: bool = True,
+                       order: str = "statut", top: int | None = None, atc_level: int = 5) -> dict:
+        """Positions par tier, classées selon ``order`` (voir ranked ; avec ``top``, seule la
+        tête de chaque tier est triée). Voir tier_members pour ``subset`` et ``atc_level``."""
+        tiers = self.tier_members(ref_pos, in_view, subset, atc_level)
+        return {k: self.ranked(v, order, top) for k, v in tiers.items()}
+
+    @timed("group_similars")
+    def tier_members(self, ref_pos: int, in_view=None, subset: bool = True, atc_level: int = 5) -> dict:
+        """Positions croissantes (int64) de chaque tier, non classées. ``subset`` : B/C acceptent
+        aussi les produits dont la DCI contient celle de la référence. ``atc_level`` : D = même
+        code ATC (5) ou même préfixe au niveau 4 (C09CA), 3 (C09C), 2 (C09) ou 1 (C), lu comme
+        une plage de l'index."""
+        index = self.index
+        spec, url, forme = self.specialite, self.detail_url, self.forme_norm
+        ref_mols = index["mols"][ref_pos]
+        ref_form = forme[ref_pos]
+        ref_atc  = self.atc_code[ref_pos]
+        def keep(i):
+            if in_view is not None and not in_view[i]: return False
+            return not (spec[i] == spec[ref_pos] and url[i] == url[ref_pos])
+        g = index["classe_A"][ref_pos]
+        same_class_A = set(index["membres_A"][g]) if g >= 0 else set()
+        if subset:
+            same_inn = containing_all(index, ref_mols)
+        else:
+            same_inn = set(index["by_key"].get(mol_key(ref_mols), [])) if ref_mols else set()
+        tiers = {"A": [], "B": [], "C": [], "D": []}
+        for i in sorted(same_inn):
+            if not keep(i): continue
+            if i in same_class_A:
+                tiers["A"].append(i)
+            elif forme[i] == ref_form and ref_form != "":
+                tiers["B"].append(i)
+            else:
+                tiers["C"].append(i)
+        near = atc_neighbours(index, ref_atc, atc_level)
+        count("rows_scanned", len(same_inn) + len(near))
+        if same_inn:
+            near = near[~np.isin(near, np.fromiter(same_inn, dtype=np.int64, count=len(same_inn)))]
+        if in_view is not None:
+            near = near[in_view[near]]
+        tiers["D"] = [i for i in near.tolist() if not (spec[i] == spec[ref_pos] and url[i] == url[ref_pos])]
+        return {k: np.asarray(v, dtype=np.int64) for k, v in tiers.items()}
+
+    def atc_counts(self, ref_pos: int) -> dict:
+        """{niveau ATC 1–5: (préfixe, lignes du jeu sous ce préfixe)} pour la référence."""
+        return atc_level_counts(self.index, self.atc_code[ref_pos])
+
+    def group_similars(self, ref: pd.Series, formes=(), statuts=(), subset: bool = True,
+                       order: str = "statut", atc_level: int = 5) -> dict:
+        tiers = self.tier_positions(ref.name, self.selection(formes, statuts), subset, order, atc_level=atc_level)
+        return {k: self.rows(v) for k, v in tiers.items()}
+
+    # ---------------- REQUÊTES BOOLÉENNES SUR LES MOLÉCULES ----------------
+    def molecule_query(self, expr: str, formes=(), statuts=(), order: str = "statut",
+                       top: int | None = None) -> tuple[list, dict]:
+        """(positions classées, terme -> molécules retenues) des produits satisfaisant
+        ``expr`` (voir medsim.query : « amoxicilline et acide clavulanique », « paracetamol
+        sauf codeine »…), restreints aux filtres. ValueError si l'expression est mal formée."""
+        self.rank_of(order)
+        expr = query_key(expr)
+        pos, resolved = self.results.get_or_compute(  # classement à la lecture, comme search
+            self.cache_key("molecules", expr, formes, statuts),
+            lambda: self.molecule_positions(expr, self.selection(formes, statuts)))
+        return self.ranked(pos, order, top), resolved
+
+    @timed("molecule_query")
+    def molecule_positions(self, expr: str, in_view=None) -> tuple[np.ndarray, dict]:
+        """Positions croissantes et résolution des termes, par opérations sur les listes triées
+        de by_mol : le coût suit la taille des listes des molécules citées."""
+        tree = parse(expr)
+        if self.mol_names is None:
+            self.mol_names = sorted(self.index["by_mol"])
+        by_mol, resolved = self.index["by_mol"], {}
+        def lookup(term):
+            mols = resolved[term] = resolve(term, self.mol_names, self.closest_molecule)
+            lists = [np.asarray(by_mol[m], dtype=np.int64) for m in mols]
+            count("rows_scanned", sum(map(len, lists)))
+            if len(lists) == 1: return lists[0]
+            return np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int64)
+        pos = evaluate(tree, lookup, self.n)
+        return (pos if in_view is None else pos[in_view[pos]]), resolved
+
+    def closest_molecule(self, term: str, names: list) -> str | None:
+        k, _, ok = best_fuzzy(term, names)
+        return names[k] if ok and k is not None else None
+
+    # ---------------- DOSAGE À TOLÉRANCE PRÈS ----------------
+    @timed("dose_similars")
+    def dose_positions(self, ref_pos: int, tolerance: float = 0.1, in_view=None, same_forme: bool = True) -> list:
+        """Mêmes molécules que la référence et dosage à ±tolerance (0.1 = 10 %) près, comparé
+        en unités canoniques (100 µg = 0.1 mg) ; du plus proche au plus éloigné, puis nom."""
+        index = self.index
+        ref_mols = index["mols"][ref_pos]
+        if not ref_mols: return []
+        cand = np.asarray(index["by_key"].get(mol_key(ref_mols), []), dtype=np.int64)
+        if in_view is not None: cand = cand[in_view[cand]]
+        if same_forme:
+            codes = self.filter_codes["forme_norm"][0]
+            cand = cand[codes[cand] == codes[ref_pos]]
+        count("rows_scanned", len(cand))
+        hits = within_strength(index, ref_pos, cand, tolerance).tolist()
+        ptr, value = index["strength_ptr"], index["strength_value"]
+        ref_v = value[ptr[ref_pos]:ptr[ref_pos + 1]]
+        spec, url = self.specialite, self.detail_url
+        def gap(i):
+            d = np.abs(value[ptr[i]:ptr[i + 1]] - ref_v) / np.maximum(np.abs(ref_v), 1e-12)
+            return float(d.max()), spec[i]
+        return sorted((i for i in hits if not (spec[i] == spec[ref_pos] and url[i] == url[ref_pos])), key=gap)
+
+    def dose_similars(self, ref: pd.Series, tolerance: float = 0.1, formes=(), statuts=(),
+                      same_forme: bool = True) -> list[pd.Series]:
+        return self.rows(self.dose_positions(ref.name, tolerance, self.selection(formes, statuts), same_forme))
+
+# ---------------- MOTEUR COURANT D'UN CSV ----------------
+class PrefixSuggester:
+    """Suggestions par préfixe des noms commerciaux, sur un jeu normalisé mais pas encore
+    indexé : de quoi répondre pendant le préchauffage (ni DCI, ni fuzzy, ni filtres)."""
+
+    def __init__(self, df: pd.DataFrame):
+        keys = df["brand_key"].astype(str).tolist()
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.sorted_keys = [keys[o] for o in order]
+        self.order = np.asarray(order, dtype=np.int64)
+        self.names = df["specialite"].astype(str).tolist()
+
+    def suggest(self, q: str, max_suggestions: int = 8) -> list[str]:
+        qn = strip_accents(q).lower().strip()
+        if not qn: return []
+        lo = bisect_left(self.sorted_keys, qn)
+        hi = bisect_left(self.sorted_keys, qn + "\U0010ffff", lo)
+        out = []
+        for o in np.sort(self.order[lo:hi]).tolist():  # ordre du catalogue, comme suggest
+            if self.names[o] not in out:
+                out.append(self.names[o])
+                if len(out) >= max_suggestions: break
+        return out
+
+def warm_engine(engine: SimilarityEngine) -> None:
+    """Premier appel de chaque chemin coûteux (import de rapidfuzz, fuzzy, classement,
+    autocomplétion), hors cache de résultats : le premier visiteur ne les paie pas."""
+    load_rapidfuzz()
+    if engine.n:
+        # nom mal saisi : aucun nom ne commence par « ~ », la recherche passe par le fuzzy
+        # (trigrammes puis cdist) au lieu de s'arrêter au préfixe
+        engine.find_position("~" + engine.specialite[0])
+        engine.suggest_uncached("a")
+        engine.rank_of("statut")
+
+class LiveEngine:
+    """Moteur d'un fichier CSV, rafraîchi de façon incrémentale quand le fichier change.
+
+    Le rafraîchissement se fait dans un thread, un seul à la fois : tous les appelants, y
+    compris celui qui voit le nouveau mtime, continuent sur l'ancien moteur jusqu'à ce que le
+    nouveau le remplace (seul le tout premier chargement est bloquant).
+    ``start()`` fait ce premier chargement et le préchauffage dans un thread : ``status()``
+    en donne l'avancement, et ``partial`` des suggestions par préfixe dès que le jeu est lu.
+    """
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.engine = None
+        self.mtime_ns = None
+        self.lock = threading.Lock()
+        self.state, self.stage, self.error = "idle", "", None  # idle | loading | ready | error
+        self.partial = None
+        self.thread = None
+        self.refresher = None      # thread du dernier rafraîchissement
+        self.refresh_error = None  # échec du dernier rafraîchissement (l'ancien moteur reste servi)
+        self.failed_mtime_ns = None  # mtime du fichier qui l'a fait échouer : pas réessayé
+        self.t0 = self.seconds = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        seconds = self.seconds if self.seconds is not None else (perf_counter() - self.t0 if self.t0 else 0.0)
+        return {"state": self.state, "stage": self.stage, "seconds": round(seconds, 3),
+                "rows": self.engine.n if self.engine is not None else None, "error": self.error,
+                "refresh_error": self.refresh_error}
+
+    def start(self) -> "LiveEngine":
+        """Lance le chargement et le préchauffage en arrière-plan (une seule fois, sauf échec :
+        un nouvel appel reprend alors, sans recharger un moteur déjà construit)."""
+        with self.lock:
+            if self.state == "error" or (self.thread is None and self.engine is None):
+                self.state, self.error, self.t0, self.seconds = "loading", None, perf_counter(), None
+                self.thread = threading.Thread(target=self.warm, name="medsim-warmup", daemon=True)
+                self.thread.start()
+        return self
+
+    def warm(self) -> None:
+        try:
+            with self.lock:  # les get() bloquants attendent ce chargement au lieu d'en lancer un autre
+                if self.engine is None:
+                    self.stage = "chargement"
+                    mtime_ns = Path(self.csv_path).stat().st_mtime_ns
+                    df, index = load_data(self.csv_path, on_frame=self.publish_partial)
+                    self.stage = "index"
+                    self.engine, self.mtime_ns = SimilarityEngine(df, index), mtime_ns
+            self.stage = "préchauffage"
+            warm_engine(self.engine)
+            self.state, self.stage = "ready", ""
+        except Exception as e:
+            self.state, self.error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            self.seconds = perf_counter() - self.t0
+            self.partial = None
+
+    def publish_partial(self, df: pd.DataFrame) -> None:
+        self.stage = "index"
+        self.partial = PrefixSuggester(df)
+
+    def get(self) -> SimilarityEngine:
+        mtime_ns = Path(self.csv_path).stat().st_mtime_ns
+        if mtime_ns == self.mtime_ns:
+            return self.engine
+        if self.engine is not None:
+            if mtime_ns == self.failed_mtime_ns: return self.engine  # même fichier illisible
+            if self.lock.acquire(blocking=False):  # sinon : rafraîchissement déjà en cours
+                self.refresher = threading.Thread(target=self.refresh, name="medsim-refresh", daemon=True)
+                self.refresher.start()  # libère le verrou en fin de rafraîchissement
+            return self.engine
+        with self.lock:
+            if self.engine is None:
+                self.engine = SimilarityEngine.from_csv(self.csv_path)
+                self.mtime_ns = mtime_ns
+                if self.state == "idle": self.state = "ready"
+        return self.engine
+
+    def refresh(self) -> None:
+        """Rechargement incrémental (appelé verrou pris) ; le moteur n'est remplacé qu'une
+        fois le nouveau complet. En cas d'échec, l'ancien reste servi et le fichier n'est relu
+        qu'une fois son mtime changé de nouveau."""
+        mtime_ns = None
+        try:
+            mtime_ns = Path(self.csv_path).stat().st_mtime_ns
+            if mtime_ns != self.mtime_ns:
+                self.engine = self.engine.refreshed(self.csv_path)
+                self.mtime_ns = mtime_ns
+            self.refresh_error = self.failed_mtime_ns = None
+        except Exception as e:
+            self.refresh_error, self.failed_mtime_ns = f"{type(e).__name__}: {e}", mtime_ns
+        finally:
+            self.lock.release()
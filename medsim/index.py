@@ -0,0 +1,325 @@
+# medsim/index.py — index construits une fois au chargement (listes inversées, classes, trigrammes)
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from .columns import by_value, lower_key_col
+from .dosage import canonical_doses, parse_strength
+from .normalize import split_set_norm
+
+FUZZY_CANDIDATES = 200  # candidats notés par le fuzzy après pré-filtrage trigrammes
+# colonnes brutes dont dépendent la normalisation et l'index : une ligne dont elles
+# n'ont pas bougé garde son travail (clés, ensembles, trigrammes) d'un rechargement à l'autre
+ROW_INPUTS = ("specialite", "molecules", "grammages", "forme", "atc_code")
+NO_ENTRIES = np.empty(0, dtype=np.int32)
+ATC_LEVELS = (1, 3, 4, 5, 7)  # longueur du code aux niveaux ATC 1 à 5 (N, N02, N02B, N02BE, N02BE01)
+
+def mol_key(mols) -> str:
+    """Clé canonique d'un ensemble de molécules (ordre indifférent)."""
+    return " | ".join(sorted(mols))
+
+def build_index(df) -> dict:
+    """Index construit une fois au chargement : positions de lignes par molécule,
+    par ensemble de molécules et par code ATC, plus les ensembles pré-découpés."""
+    index = postings_and_classes(df, *row_sets(df))
+    index["suggest"] = build_suggest_index(df)
+    index["row_hash"] = row_hashes(df)
+    return index
+
+def interned(values, make) -> list:
+    """[make(v) for v in values], calculé une fois et partagé par valeur distincte."""
+    memo = {}
+    out = []
+    for v in values:
+        r = memo.get(v)
+        if r is None: r = memo[v] = make(v)
+        out.append(r)
+    return out
+
+def row_sets(df) -> tuple[list, list]:
+    """Ensembles de molécules et de dosages par ligne (un objet par ensemble distinct) ;
+    dosages en unités canoniques (« 1 g » et « 1000 mg » donnent le même ensemble)."""
+    split = lambda x: frozenset(split_set_norm(x))
+    return (interned(df["molecules_norm"].tolist(), split),
+            interned(df["grammages_norm"].tolist(), canonical_doses))
+
+def postings_and_classes(df, mols: list, doses: list) -> dict:
+    """Listes inversées et classes de substitution à partir des ensembles par ligne."""
+    memo = {}  # peu d'ensembles distincts : une clé triée par ensemble, pas par ligne
+    def key(ms):
+        k = memo.get(ms)
+        if k is None: k = memo[ms] = mol_key(ms)
+        return k
+    by_mol, by_key = {}, {}
+    for i, ms in enumerate(mols):
+        for m in ms:
+            by_mol.setdefault(m, []).append(i)
+        if ms:
+            by_key.setdefault(key(ms), []).append(i)
+    # codes ATC triés (puis position) : un code ou un préfixe = une plage contiguë
+    atc = [(a or "").strip() for a in df["atc_code"].tolist()]
+    atc_order = sorted((i for i, a in enumerate(atc) if a), key=atc.__getitem__)
+    # classes de substitution A : (molécules, forme, dosage) ; B se lit sur containing_all
+    formes = df["forme_norm"].tolist()
+    classe_A, membres_A = substitution_classes(
+        (key(ms), f, key(d)) if ms and f and d else None
+        for ms, f, d in zip(mols, formes, doses))
+    return {"n": len(df), "mols": mols, "doses": doses,
+            "by_mol": by_mol, "by_key": by_key,
+            "atc_codes": [atc[i] for i in atc_order], "atc_order": np.asarray(atc_order, dtype=np.int32),
+            "classe_A": np.asarray(classe_A, dtype=np.int32), "membres_A": membres_A,
+            **strength_arrays(doses)}
+
+def strength_arrays(doses: list) -> dict:
+    """Dosages par ligne en tableaux numériques : les parties de la ligne i occupent
+    [strength_ptr[i], strength_ptr[i+1]) de strength_value / strength_unit, triées par
+    (unité, valeur). Une partie non reconnue devient une unité à part entière (son texte),
+    de valeur 1 : elle ne correspond qu'à elle-même."""
+    units = {}
+    def part(t):
+        s = parse_strength(t)
+        unit, v = (t, 1.0) if s is None else (s[1], s[0])
+        return units.setdefault(unit, len(units)), v
+    rows = interned(doses, lambda d: sorted(map(part, d)))
+    ptr = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum([len(p) for p in rows], out=ptr[1:])
+    flat = [x for p in rows for x in p]
+    return {"strength_ptr": ptr,
+            "strength_unit": np.fromiter((u for u, _ in flat), dtype=np.int32, count=len(flat)),
+            "strength_value": np.fromiter((v for _, v in flat), dtype=np.float64, count=len(flat)),
+            "strength_units": list(units)}
+
+def build_suggest_index(df) -> dict:
+    """Autocomplétion : noms puis DCI (même ordre que l'affichage), clés normalisées
+    une seule fois, triées pour la recherche par préfixe, et trigrammes pour « contient »."""
+    combos = suggest_entries(df)
+    # clés des noms : la colonne brand_key déjà calculée ; DCI : une fois par valeur distincte
+    keys = df["brand_key"].tolist() + by_value(combos[len(df):], lower_key_col).tolist()
+    return suggest_from_keys(len(df), combos, keys, trigram_postings(enumerate(keys)))
+
+def suggest_entries(df) -> list:
+    """Noms puis DCI ; str() renvoie la chaîne elle-même, partagée avec les catégories du df."""
+    return list(map(str, df["specialite"].tolist())) + list(map(str, df["molecules"].tolist()))
+
+def suggest_from_keys(n: int, combos: list, keys: list, grams: dict) -> dict:
+    """Listes d'entiers en tableaux int32 : 4 octets par entrée au lieu d'un objet Python."""
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return {"n": n, "combos": combos, "keys": keys,
+            "sorted_keys": [keys[o] for o in order], "order": np.asarray(order, dtype=np.int32),
+            "grams": {g: np.asarray(p, dtype=np.int32) for g, p in grams.items()}}
+
+def trigram_postings(entries) -> dict:
+    """trigramme -> entrées (croissantes si ``entries`` l'est) dont la clé le contient."""
+    grams = {}
+    for o, k in entries:
+        for g in {k[j:j+3] for j in range(len(k) - 2)}:
+            grams.setdefault(g, []).append(o)
+    return grams
+
+def substitution_classes(keys) -> tuple[list, list]:
+    """Numérote les classes d'équivalence : id de classe par ligne (-1 si clé absente)
+    et liste des positions membres par id."""
+    ids, classe, membres = {}, [], []
+    for i, k in enumerate(keys):
+        if k is None:
+            classe.append(-1)
+            continue
+        g = ids.setdefault(k, len(ids))
+        if g == len(membres):
+            membres.append([])
+        membres[g].append(i)
+        classe.append(g)
+    return classe, membres
+
+# ---------------- RECHARGEMENT INCRÉMENTAL ----------------
+def row_hashes(df) -> np.ndarray:
+    """Empreinte par ligne des colonnes ROW_INPUTS (absentes = vides). En object avant fillna :
+    une colonne catégorielle sans valeur vide n'a pas "" parmi ses catégories."""
+    cols = df.reindex(columns=list(ROW_INPUTS)).astype(object).fillna("")
+    return pd.util.hash_pandas_object(cols, index=False).to_numpy()
+
+def match_rows(df, old_df, old_index: dict) -> np.ndarray:
+    """Pour chaque ligne de ``df`` : sa position dans l'ancien jeu si le même detail_url y
+    existe avec des ROW_INPUTS identiques, -1 sinon (ligne ajoutée ou modifiée).
+    Une ancienne ligne n'est reprise qu'une fois ; les URL vides ne sont jamais appariées."""
+    old_urls = old_df["detail_url"].to_numpy()
+    keep = np.flatnonzero(~pd.Series(old_urls).duplicated().to_numpy() & (old_urls != ""))
+    new_urls = (df["detail_url"].fillna("").to_numpy() if "detail_url" in df.columns
+                else np.full(len(df), ""))
+    hit = pd.Index(old_urls[keep]).get_indexer(new_urls)
+    pos = np.full(len(hit), -1, dtype=np.int64)
+    pos[hit >= 0] = keep[hit[hit >= 0]]  # keep peut être vide (aucune URL dans l'ancien jeu)
+    found = pos >= 0
+    found[found] = old_index["row_hash"][pos[found]] == row_hashes(df)[found]
+    pos = np.where(found, pos, -1)
+    pos[pd.Series(pos).duplicated().to_numpy() & (pos >= 0)] = -1
+    return pos
+
+def patch_index(old: dict, df, old_pos: np.ndarray) -> dict:
+    """Index du nouveau jeu ``df`` (déjà normalisé) en reprenant de l'ancien index les
+    clés et trigrammes des lignes inchangées (``old_pos`` de match_rows).
+    Résultat identique à build_index(df) ; l'ancien index n'est pas modifié."""
+    index = postings_and_classes(df, *row_sets(df))  # ensembles : un calcul par valeur distincte
+    index["suggest"] = patch_suggest_index(old["suggest"], df, old_pos)
+    index["row_hash"] = row_hashes(df)
+    return index
+
+def patch_suggest_index(old: dict, df, old_pos: np.ndarray) -> dict:
+    """Comme build_suggest_index(df), en renumérotant les listes de trigrammes de l'ancien
+    index au lieu de les recalculer ; seules les entrées nouvelles sont découpées."""
+    n, n_old = len(df), old["n"]
+    combos = suggest_entries(df)
+    # entrée e du nouveau tableau -> entrée de l'ancien (noms puis DCI), -1 si à recalculer
+    old_entry = np.concatenate([old_pos, np.where(old_pos >= 0, old_pos + n_old, -1)])
+    old_keys = old["keys"]
+    mol_keys = [old_keys[p + n_old] if p >= 0 else None for p in old_pos.tolist()]
+    todo = [i for i, k in enumerate(mol_keys) if k is None]
+    for i, k in zip(todo, by_value([combos[n + i] for i in todo], lower_key_col).tolist()):
+        mol_keys[i] = k
+    keys = df["brand_key"].tolist() + mol_keys
+    new_of_old = np.full(2 * n_old, -1, dtype=np.int64)
+    new_of_old[old_entry[old_entry >= 0]] = np.flatnonzero(old_entry >= 0)
+    fresh = trigram_postings((o, keys[o]) for o in np.flatnonzero(old_entry < 0).tolist())
+    grams = {}
+    for g, p in old["grams"].items():
+        moved = new_of_old[p]
+        moved = moved[moved >= 0]
+        if g in fresh:
+            moved = np.concatenate([moved, fresh.pop(g)])
+        if len(moved):
+            grams[g] = np.sort(moved)
+    grams.update(fresh)
+    return suggest_from_keys(n, combos, keys, grams)
+
+# ---------------- RÉUNION DE PARTITIONS ----------------
+def merge_indexes(df, indexes: list) -> dict:
+    """Index de ``df`` = concaténation des jeux indexés par ``indexes`` (dans l'ordre), en
+    décalant leurs positions au lieu de tout reconstruire. Identique à build_index(df)."""
+    mols  = [ms for ix in indexes for ms in ix["mols"]]
+    doses = [d for ix in indexes for d in ix["doses"]]
+    index = postings_and_classes(df, mols, doses)
+    index["suggest"] = merge_suggest_indexes([ix["suggest"] for ix in indexes])
+    index["row_hash"] = np.concatenate([ix["row_hash"] for ix in indexes])
+    return index
+
+def merge_suggest_indexes(parts: list) -> dict:
+    """Entrées réunies : tous les noms, puis toutes les DCI, partition par partition."""
+    n = sum(sx["n"] for sx in parts)
+    combos, keys, grams = [None] * (2 * n), [None] * (2 * n), {}
+    off = 0
+    for sx in parts:
+        m = sx["n"]
+        # entrée e de la partition -> nom en off + e, DCI en n + off + (e - m)
+        combos[off:off + m], combos[n + off:n + off + m] = sx["combos"][:m], sx["combos"][m:]
+        keys[off:off + m], keys[n + off:n + off + m] = sx["keys"][:m], sx["keys"][m:]
+        for g, p in sx["grams"].items():
+            grams.setdefault(g, []).append(np.where(p < m, p + off, p - m + n + off))
+        off += m
+    return suggest_from_keys(n, combos, keys, {g: np.sort(np.concatenate(ps)) for g, ps in grams.items()})
+
+# ---------------- LECTURES ----------------
+def containing_all(index: dict, mols) -> set:
+    """Positions des lignes contenant toutes les molécules (intersection des listes)."""
+    if not mols: return set()
+    postings = sorted((index["by_mol"].get(m, []) for m in mols), key=len)
+    out = set(postings[0])
+    for p in postings[1:]:
+        out.intersection_update(p)
+        if not out: break
+    return out
+
+def within_strength(index: dict, ref_pos: int, cand, tolerance: float) -> np.ndarray:
+    """Positions de ``cand`` dont le dosage a les mêmes parties (mêmes unités) que celui de
+    ``ref_pos``, chaque valeur à ±tolerance (fraction, 0.1 = 10 %) près ; tableaux seulement."""
+    ptr, unit, value = index["strength_ptr"], index["strength_unit"], index["strength_value"]
+    cand = np.asarray(cand, dtype=np.int64)
+    lo, k = ptr[ref_pos], ptr[ref_pos + 1] - ptr[ref_pos]
+    if k == 0 or not len(cand):
+        return cand[:0]
+    cand = cand[ptr[cand + 1] - ptr[cand] == k]
+    at = ptr[cand][:, None] + np.arange(k)  # parties des candidats, une ligne par candidat
+    ref_v = value[lo:lo + k]
+    ok = (unit[at] == unit[lo:lo + k]).all(axis=1)
+    ok &= (np.abs(value[at] - ref_v) <= tolerance * np.abs(ref_v) + 1e-12).all(axis=1)
+    return cand[ok]
+
+def atc_bounds(index: dict, code: str, level: int = 5) -> tuple[int, int]:
+    """Plage de atc_codes partageant avec ``code`` le préfixe du niveau ATC ``level`` (1–5) ;
+    niveau 5 : code identique. Deux recherches dichotomiques, quelle que soit la largeur."""
+    codes = index["atc_codes"]
+    if level >= len(ATC_LEVELS):
+        return bisect_left(codes, code), bisect_right(codes, code)
+    prefix = code[:ATC_LEVELS[level - 1]]
+    return bisect_left(codes, prefix), bisect_left(codes, prefix + "\U0010ffff")
+
+def atc_neighbours(index: dict, code: str, level: int = 5) -> np.ndarray:
+    """Positions (croissantes) des lignes au même niveau ATC ``level`` que ``code``."""
+    if not code: return NO_ENTRIES
+    lo, hi = atc_bounds(index, code, level)
+    return np.sort(index["atc_order"][lo:hi])
+
+def atc_level_counts(index: dict, code: str) -> dict:
+    """{niveau: (préfixe, nombre de lignes)} pour les niveaux 1 à 5 de ``code``."""
+    if not code: return {}
+    out = {}
+    for level in range(1, len(ATC_LEVELS) + 1):
+        lo, hi = atc_bounds(index, code, level)
+        out[level] = (code if level == len(ATC_LEVELS) else code[:ATC_LEVELS[level - 1]], hi - lo)
+    return out
+
+def prefix_bounds(sx: dict, qn: str, lo: int = 0, hi: int | None = None) -> tuple[int, int]:
+    """Plage de sorted_keys commençant par qn ; [lo, hi) : plage d'un préfixe de qn déjà trouvée."""
+    keys = sx["sorted_keys"]
+    hi = len(keys) if hi is None else hi
+    return bisect_left(keys, qn, lo, hi), bisect_left(keys, qn + "\U0010ffff", lo, hi)
+
+def prefix_entries(sx: dict, qn: str) -> list:
+    """Entrées (noms + DCI) dont la clé normalisée commence par qn, ordre quelconque."""
+    lo, hi = prefix_bounds(sx, qn)
+    return sx["order"][lo:hi].tolist()
+
+def contains_array(sx: dict, qn: str, within=None, known: str = ""):
+    """Sur-ensemble trié (int32) des entrées dont la clé contient qn, None si qn est trop court
+    pour les trigrammes (toutes les entrées). ``within`` : ce sur-ensemble déjà calculé pour
+    ``known``, sous-chaîne de qn ; seuls les trigrammes absents de ``known`` sont intersectés."""
+    if len(qn) < 3:
+        return None
+    grams = {qn[j:j+3] for j in range(len(qn) - 2)}
+    if within is not None and known in qn:
+        grams -= {known[j:j+3] for j in range(len(known) - 2)}
+        postings = [within]
+    else:
+        postings = []
+    postings = sorted(postings + [sx["grams"].get(g, NO_ENTRIES) for g in grams], key=len)
+    cand = postings[0]
+    for p in postings[1:]:
+        if not len(cand): break
+        cand = np.intersect1d(cand, p, assume_unique=True)
+    return cand
+
+def contains_candidates(sx: dict, qn: str):
+    """Sur-ensemble trié des entrées dont la clé contient qn (à vérifier par l'appelant)."""
+    cand = contains_array(sx, qn)
+    return range(len(sx["keys"])) if cand is None else cand.tolist()
+
+def fuzzy_candidates(sx: dict, qn: str, start: int, stop: int, in_view=None,
+                     limit: int = FUZZY_CANDIDATES) -> list:
+    """Entrées de [start, stop) partageant le plus de trigrammes avec qn, dans l'ordre du tableau.
+    ``in_view`` : masque booléen par position de ligne (None = toutes les lignes)."""
+    n = sx["n"]
+    if len(qn) < 3:
+        return [o for o in range(start, stop) if in_view is None or in_view[o % n]]
+    parts = []
+    for g in {qn[j:j+3] for j in range(len(qn) - 2)}:
+        p = sx["grams"].get(g, NO_ENTRIES)
+        parts.append(p[np.searchsorted(p, start):np.searchsorted(p, stop)])
+    cand, counts = np.unique(np.concatenate(parts), return_counts=True) if parts else (NO_ENTRIES, NO_ENTRIES)
+    if in_view is not None:
+        keep = in_view[cand % n]
+        cand, counts = cand[keep], counts[keep]
+    if len(cand) > limit:
+        # tri stable sur -compte : à égalité, la plus petite entrée d'abord (cand est croissant)
+        cand = np.sort(cand[np.argsort(-counts, kind="stable")[:limit]])
+    return cand.tolist()
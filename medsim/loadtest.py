@@ -0,0 +1,135 @@
+# medsim/loadtest.py — charge sur une instance locale de medsim.api
+#
+#   python -m medsim.loadtest --serve data_full_with_dr_luna.csv -c 64 -n 5000
+#   python -m medsim.loadtest --url http://127.0.0.1:8765 --endpoint suggest -c 32 -d 20
+#   python -m medsim.loadtest --serve data_full.csv --endpoint typing -c 16 -d 20
+#
+# Des connexions keep-alive (-c) envoient les requêtes en boucle fermée ; les requêtes sont
+# tirées du CSV comme dans medsim.bench (préfixes, fautes, DCI). Sortie : débit, latences
+# p50/p90/p99 et répartition des statuts HTTP, sur stderr et en une ligne JSON sur stdout.
+# « typing » envoie chaque requête frappe par frappe (/suggest, un identifiant de session
+# par requête) : les connexions se partagent les frappes d'un même mot comme un client rapide.
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+from itertools import count as counter
+from urllib.parse import quote, urlsplit
+
+import pandas as pd
+
+from .bench import make_queries, percentiles
+
+ENDPOINTS = ("suggest", "reference", "similars", "mix", "typing")
+
+async def get(reader, writer, host: str, target: str) -> int:
+    """Une requête GET sur une connexion ouverte ; renvoie le statut (corps lu puis ignoré)."""
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b""):
+            break
+        k, _, v = h.decode("latin-1").partition(":")
+        if k.strip().lower() == "content-length":
+            length = int(v)
+    await reader.readexactly(length)
+    return status
+
+async def wait_ready(host: str, port: int, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            status = await get(reader, writer, host, "/health")
+            writer.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"aucune réponse de {host}:{port}")
+        await asyncio.sleep(0.2)
+
+async def run(url: str, targets: list[str], connections: int, total: int | None, duration: float | None) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    await wait_ready(host, port)
+    latencies, statuses = [], Counter()
+    seq = counter()
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while True:
+                k = next(seq)
+                if (total is not None and k >= total) or (deadline and time.perf_counter() > deadline):
+                    return
+                t = time.perf_counter()
+                try:
+                    statuses[await get(reader, writer, host, targets[k % len(targets)])] += 1
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    statuses["connexion perdue"] += 1
+                    reader, writer = await asyncio.open_connection(host, port)
+                    continue
+                latencies.append(time.perf_counter() - t)
+        finally:
+            writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - t0
+    return {"requests": sum(statuses.values()), "seconds": round(elapsed, 3),
+            "rps": round(sum(statuses.values()) / elapsed, 1), "connections": connections,
+            "statuses": {str(k): v for k, v in statuses.items()},
+            "latency": percentiles(latencies) if latencies else {}}
+
+def build_targets(csv_path: str, endpoint: str, n: int) -> list[str]:
+    queries = make_queries(pd.read_csv(csv_path, dtype=str), n)
+    if endpoint == "typing":
+        return [f"/suggest?q={quote(q[:j])}&session=t{k}" for k, q in enumerate(queries) for j in range(1, len(q) + 1)]
+    routes = ("suggest", "reference", "similars") if endpoint == "mix" else (endpoint,)
+    return [f"/{routes[k % len(routes)]}?q={quote(q)}" for k, q in enumerate(queries)]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.loadtest",
+                                 description="Test de charge de l'API medsim sur une instance locale.")
+    ap.add_argument("--url", default="http://127.0.0.1:8765", help="adresse de l'API (défaut : %(default)s)")
+    ap.add_argument("--serve", metavar="CSV", help="démarre d'abord `python -m medsim.api` sur ce CSV")
+    ap.add_argument("--queries-from", default="data_full.csv", help="CSV d'où tirer les requêtes")
+    ap.add_argument("--endpoint", choices=ENDPOINTS, default="mix")
+    ap.add_argument("--distinct", type=int, default=2000, help="requêtes distinctes (défaut : 2000)")
+    ap.add_argument("-c", "--connections", type=int, default=32)
+    ap.add_argument("-n", "--requests", type=int, help="nombre total de requêtes")
+    ap.add_argument("-d", "--duration", type=float, help="durée en secondes (défaut : 10 s si -n absent)")
+    args = ap.parse_args(argv)
+
+    server = None
+    if args.serve:
+        port = urlsplit(args.url).port or 80
+        server = subprocess.Popen([sys.executable, "-m", "medsim.api", "--data", args.serve, "--port", str(port)])
+    try:
+        duration = args.duration or (None if args.requests else 10.0)
+        res = asyncio.run(run(args.url, build_targets(args.queries_from, args.endpoint, args.distinct),
+                              args.connections, args.requests, duration))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    res["endpoint"] = args.endpoint
+    print(json.dumps(res, ensure_ascii=False))
+    lat = res["latency"]
+    print(f"{res['requests']} requêtes en {res['seconds']} s : {res['rps']} req/s, "
+          f"p50 {lat.get('p50_ms', 0)} ms, p99 {lat.get('p99_ms', 0)} ms, statuts {res['statuses']}",
+          file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
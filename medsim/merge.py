@@ -0,0 +1,164 @@
+# medsim/merge.py — fusion de plusieurs CSV sources en un seul catalogue dédoublonné
+#
+#   python -m medsim.merge data_full.csv data_full_with_dr_luna.csv -o catalogue.csv
+#   python -m medsim.merge a.csv b.csv -o catalogue.csv --keys detail_url,auth_number --by last_seen
+#
+# Une ligne est identifiée par la première colonne de --keys non vide (URL sans schéma ni
+# « / » final, numéro d'AMM sans espaces ni ponctuation…), sinon par une empreinte de son
+# contenu hors colonnes de collecte (scraped_at, last_seen). Entre doublons, la ligne la plus
+# récente selon --by l'emporte ; à égalité, celle de la source citée en dernier.
+# (dci_signature est partagée par tous les génériques d'une molécule : elle fait partie de
+# l'empreinte, pas de l'identité.)
+#
+# Mémoire bornée quelle que soit la taille des entrées, en trois passes par paquets :
+#   1. chaque source est lue par paquets, valeurs nettoyées ; (clé, date, source, ligne) est
+#      réparti par hachage de la clé dans des fichiers de seaux sur disque ;
+#   2. chaque seau (une fraction des clés) désigne ses gagnantes, marquées dans un tableau de
+#      booléens par source, projeté sur disque (memmap) ;
+#   3. les sources sont relues par paquets et seules les gagnantes sont écrites, colonnes
+#      alignées et valeurs nettoyées, dans l'ordre des sources puis des lignes.
+# La sortie est écrite à côté puis renommée : un LiveEngine qui la surveille ne lit jamais
+# un fichier à moitié écrit.
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .columns import by_value, lower_key_col
+from .engine import CHUNK_ROWS
+
+DEFAULT_KEYS = ("detail_url", "auth_number")
+ORDER_COLUMN = "last_seen"
+VOLATILE = {"scraped_at", "last_seen"}  # hors empreinte de contenu
+BUCKET_INPUT_BYTES = 32 << 20           # entrée par seau : borne la mémoire de la passe 2
+MAX_BUCKETS = 512                       # fichiers de seaux ouverts à la fois (soit 16 Go d'entrée)
+OLDEST = np.iinfo(np.int64).min         # date absente ou illisible
+
+def url_key_col(u: pd.Series) -> pd.Series:
+    """« https://www.site.ma/med/x/ » et « http://site.ma/med/x » -> « site.ma/med/x »."""
+    s = u.astype(str).str.strip().str.lower()
+    return s.str.replace(r"^https?://(?:www\.)?", "", regex=True).str.rstrip("/")
+
+def code_key_col(u: pd.Series) -> pd.Series:
+    """Numéros et codes : sans accents ni casse, sans espaces ni ponctuation."""
+    return lower_key_col(u.astype(str)).str.replace(r"[\s./_-]", "", regex=True)
+
+KEY_NORMALIZERS = {"detail_url": url_key_col, "notice_url": url_key_col}
+
+def source_columns(paths: list[str]) -> list[str]:
+    """Réunion des en-têtes, dans l'ordre de première apparition."""
+    cols = {}
+    for p in paths:
+        cols.update(dict.fromkeys(pd.read_csv(p, dtype=str, nrows=0).columns))
+    return list(cols)
+
+def read_chunks(path: str, columns: list[str], chunksize: int):
+    """Paquets d'une source alignés sur ``columns`` (colonnes absentes : "")."""
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize):
+        yield chunk.reindex(columns=columns, fill_value="")
+
+def row_keys(chunk: pd.DataFrame, keys) -> np.ndarray:
+    """Clé de chaque ligne : « colonne:valeur normalisée » de la première clé non vide,
+    sinon « #empreinte » du contenu (sans accents ni casse, hors colonnes de collecte)."""
+    out = np.full(len(chunk), "", dtype=object)
+    for k in keys:
+        if k not in chunk.columns: continue
+        vals = by_value(chunk[k], KEY_NORMALIZERS.get(k, code_key_col))
+        todo = (out == "") & (vals != "")
+        out[todo] = k + ":" + vals[todo]
+    missing = np.flatnonzero(out == "")
+    if len(missing):
+        content = pd.DataFrame({c: by_value(chunk[c].to_numpy()[missing], lower_key_col)
+                                for c in sorted(chunk.columns) if c not in VOLATILE})
+        out[missing] = [f"#{h:016x}" for h in pd.util.hash_pandas_object(content, index=False).to_numpy()]
+    return out
+
+def order_values(chunk: pd.DataFrame, by: str) -> np.ndarray:
+    """Date de ``by`` en int64 (ns, UTC) ; OLDEST si absente ou illisible."""
+    if not by or by not in chunk.columns:
+        return np.full(len(chunk), OLDEST, dtype=np.int64)
+    ts = pd.to_datetime(chunk[by], utc=True, errors="coerce", format="ISO8601").dt.tz_convert(None)
+    return ts.to_numpy(dtype="datetime64[ns]").view(np.int64)  # NaT -> OLDEST
+
+def clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Valeurs sans espaces de tête ni de fin (une valeur blanche devient vide)."""
+    return chunk.apply(lambda c: c.str.strip())
+
+def merge_sources(paths: list[str], output: str, keys=DEFAULT_KEYS, by: str = ORDER_COLUMN,
+                  chunksize: int = CHUNK_ROWS) -> dict:
+    """Écrit ``output`` : les lignes de ``paths`` dédoublonnées (voir l'en-tête du module) ;
+    renvoie les nombres de lignes lues, gardées et écartées."""
+    columns = source_columns(paths)
+    buckets = min(MAX_BUCKETS, 1 + sum(Path(p).stat().st_size for p in paths) // BUCKET_INPUT_BYTES)
+    out = Path(output)
+    with tempfile.TemporaryDirectory(prefix="medsim-merge-", dir=out.parent) as tmp:
+        # 1. (clé, date, source, ligne) répartis par seau de hachage de la clé
+        spills = [open(Path(tmp) / f"bucket{b}.csv", "w", newline="", encoding="utf-8") for b in range(buckets)]
+        sizes = []
+        try:
+            for s, path in enumerate(paths):
+                start = 0
+                for chunk in read_chunks(path, columns, chunksize):
+                    chunk = clean_chunk(chunk)  # clé et empreinte sur les valeurs écrites en passe 3
+                    k = row_keys(chunk, keys)
+                    rec = pd.DataFrame({"key": k, "order": order_values(chunk, by), "source": s,
+                                        "row": np.arange(start, start + len(chunk))})
+                    bucket = pd.util.hash_array(k) % buckets
+                    for b, part in rec.groupby(bucket, sort=False):
+                        part.to_csv(spills[b], header=False, index=False)
+                    start += len(chunk)
+                sizes.append(start)
+        finally:
+            for f in spills: f.close()
+        # 2. gagnante de chaque clé, seau par seau : date, puis source, puis ligne la plus tardive
+        winners = [np.memmap(Path(tmp) / f"source{s}.win", dtype=bool, mode="w+", shape=(n,)) if n
+                   else np.zeros(0, dtype=bool) for s, n in enumerate(sizes)]
+        for b in range(buckets):
+            path = Path(tmp) / f"bucket{b}.csv"
+            if not path.stat().st_size: continue
+            rec = pd.read_csv(path, names=["key", "order", "source", "row"], dtype={"key": str},
+                              keep_default_na=False)
+            win = rec.sort_values(["key", "order", "source", "row"]).drop_duplicates("key", keep="last")
+            for s, rows in win.groupby("source")["row"]:
+                winners[s][rows.to_numpy()] = True
+        # 3. relecture des sources : gagnantes seulement, dans l'ordre
+        partial = Path(tmp) / "merged.csv"
+        kept = 0
+        with open(partial, "w", newline="", encoding="utf-8") as fh:
+            pd.DataFrame(columns=columns).to_csv(fh, index=False)
+            for s, path in enumerate(paths):
+                start = 0
+                for chunk in read_chunks(path, columns, chunksize):
+                    keep = np.asarray(winners[s][start:start + len(chunk)])
+                    start += len(chunk)
+                    if keep.any():
+                        clean_chunk(chunk[keep]).to_csv(fh, header=False, index=False)
+                        kept += int(keep.sum())
+        del winners  # memmaps fermées avant la suppression du répertoire temporaire
+        os.replace(partial, out)
+    return {"sources": dict(zip(paths, sizes)), "rows": sum(sizes), "kept": kept,
+            "duplicates": sum(sizes) - kept, "buckets": buckets}
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.merge",
+                                 description="Fusionne des CSV sources en un catalogue dédoublonné.")
+    ap.add_argument("csv", nargs="+", help="CSV sources (à date égale, la dernière citée l'emporte)")
+    ap.add_argument("-o", "--output", required=True, help="CSV fusionné")
+    ap.add_argument("--keys", default=",".join(DEFAULT_KEYS),
+                    help=f"colonnes d'identité, par priorité (défaut : {','.join(DEFAULT_KEYS)})")
+    ap.add_argument("--by", default=ORDER_COLUMN,
+                    help=f"colonne de date : la plus récente l'emporte (défaut : {ORDER_COLUMN} ; vide : ordre des sources)")
+    args = ap.parse_args(argv)
+    stats = merge_sources(args.csv, args.output, [k.strip() for k in args.keys.split(",") if k.strip()], args.by)
+    for path, n in stats["sources"].items():
+        print(f"{path} : {n} lignes", file=sys.stderr)
+    print(f"{args.output} : {stats['kept']} lignes ({stats['duplicates']} doublons écartés)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# medsim/metrics.py — chronos par étape, compteurs et profil cProfile d'une exécution
+#
+#   with Trace("rerun") as tr:            # ou tr.start() ... tr.finish()
+#       with stage("render"): ...          # ou @timed("find_reference") sur une fonction
+#       count("candidates_scored", 200)
+#   tr.stages  -> {"find_reference": [ms cumulées, appels]}
+#
+# Sans Trace active, stage() renvoie un contexte vide partagé et count() ne fait rien :
+# le coût se limite à la lecture d'une ContextVar. Chaque Trace terminée écrit une ligne
+# JSON sur le logger « medsim.metrics » ; MEDSIM_TRACE=1 l'affiche sur stderr.
+# memory_report() détaille la mémoire occupée par un jeu chargé (colonnes, index).
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+from collections import Counter
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+ENABLED = os.environ.get("MEDSIM_TRACE", "") not in ("", "0")
+PROFILE_LINES = 30
+
+log = logging.getLogger("medsim.metrics")
+if ENABLED and not log.handlers:
+    log.addHandler(logging.StreamHandler())
+    log.setLevel(logging.INFO)
+
+current = ContextVar("medsim_trace", default=None)
+NO_STAGE = nullcontext()
+
+class Stage:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace, name):
+        self.trace, self.name = trace, name
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, perf_counter() - self.t0)
+        return False
+
+class Trace:
+    """Mesures d'une exécution (un rerun Streamlit, une requête API…)."""
+
+    def __init__(self, name: str = "rerun", profile: bool = False):
+        self.name = name
+        self.stages = {}          # étape -> [ms cumulées, appels], dans l'ordre d'apparition
+        self.counters = Counter()
+        self.profiler = cProfile.Profile() if profile else None
+        self.profile_text = ""
+        self.total_ms = 0.0
+        self.token = None
+
+    def start(self) -> "Trace":
+        self.t0 = perf_counter()
+        self.token = current.set(self)
+        if self.profiler: self.profiler.enable()
+        return self
+
+    def finish(self) -> "Trace":
+        if self.token is None: return self  # déjà terminée
+        if self.profiler:
+            self.profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            self.profile_text = out.getvalue()
+        current.reset(self.token)
+        self.token = None
+        self.total_ms = (perf_counter() - self.t0) * 1000
+        log.info(json.dumps(self.as_dict(), ensure_ascii=False))
+        return self
+
+    __enter__ = start
+
+    def __exit__(self, *exc):
+        self.finish()
+        return False
+
+    def add(self, name: str, seconds: float) -> None:
+        s = self.stages.setdefault(name, [0.0, 0])
+        s[0] += seconds * 1000
+        s[1] += 1
+
+    def as_dict(self) -> dict:
+        return {"event": "trace", "name": self.name, "total_ms": round(self.total_ms, 3),
+                "stages": {k: {"ms": round(v[0], 3), "calls": v[1]} for k, v in self.stages.items()},
+                "counters": dict(self.counters)}
+
+def stage(name: str):
+    """Chronomètre un bloc dans la Trace courante (contexte vide sinon)."""
+    tr = current.get()
+    return NO_STAGE if tr is None else Stage(tr, name)
+
+def count(key: str, n: int = 1) -> None:
+    tr = current.get()
+    if tr is not None:
+        tr.counters[key] += n
+
+def timed(name: str):
+    """Décorateur : chronomètre chaque appel sous l'étape ``name`` quand une Trace est active."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tr = current.get()
+            if tr is None:
+                return fn(*args, **kwargs)
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tr.add(name, perf_counter() - t0)
+        return wrapper
+    return deco
+
+# ---------------- MÉMOIRE ----------------
+def deep_sizeof(obj, seen: set | None = None) -> int:
+    """Octets de ``obj`` et de tout ce qu'il référence ; un objet partagé n'est compté qu'une
+    fois par ``seen``. Tableaux numpy et objets pandas : taille de leurs données."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, "memory_usage") and hasattr(obj, "dtypes"):  # DataFrame / Series
+        return int(obj.memory_usage(deep=True).sum()) if obj.ndim == 2 else int(obj.memory_usage(deep=True))
+    if hasattr(obj, "nbytes") and hasattr(obj, "dtype"):  # numpy
+        return obj.nbytes + (sum(deep_sizeof(x, seen) for x in obj.ravel()) if obj.dtype == object else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    return size
+
+def memory_report(df, index: dict) -> dict:
+    """Mo par colonne du DataFrame et par structure de l'index (approximatif : les chaînes
+    partagées entre le DataFrame et l'index sont comptées des deux côtés)."""
+    mb = lambda b: round(b / 2**20, 2)
+    frame = {c: mb(b) for c, b in df.memory_usage(deep=True, index=False).items()}
+    seen = set()
+    parts = {k: mb(deep_sizeof(v, seen)) for k, v in index.items() if k != "suggest"}
+    parts.update({f"suggest.{k}": mb(deep_sizeof(v, seen)) for k, v in index.get("suggest", {}).items()})
+    return {"rows": len(df), "frame_mb": round(sum(frame.values()), 2), "index_mb": round(sum(parts.values()), 2),
+            "columns": frame, "index": parts}
@@ -0,0 +1,35 @@
+# medsim/normalize.py — normalisation des libellés (bibliothèque standard uniquement)
+
+import unicodedata
+
+def strip_accents(s: str) -> str:
+    if not s: return s
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+def norm_pipes_lower(x: str) -> str:
+    if not x: return ""
+    x = x.replace(" / ", " | ").replace("/", " / ")
+    if "|" not in x and "," in x:
+        x = " | ".join([p.strip() for p in x.split(",")])
+    parts = [strip_accents(p).lower().strip() for p in x.split("|") if p.strip()]
+    return " | ".join(parts)
+
+# formes : remplacements préalables, puis première règle dont le motif est contenu dans le libellé
+FORME_REPLACEMENTS = (("comp.", "comprime"), ("cp", "comprime"))
+FORME_RULES = (
+    ("comprime", "COMPRIME"), ("gelule", "GELULE"), ("sirop", "SIROP"), ("solution", "SOLUTION"),
+    ("poudre", "POUDRE"), ("capsule", "CAPSULE"), ("suspension", "SUSPENSION"), ("collyre", "COLLYRE"),
+)
+FORME_MAX_LEN = 40
+
+def norm_forme(x: str) -> str:
+    s = strip_accents(str(x)).lower().strip()
+    for old, new in FORME_REPLACEMENTS:
+        s = s.replace(old, new)
+    for needle, label in FORME_RULES:
+        if needle in s: return label
+    return s.upper()[:FORME_MAX_LEN] if s else ""
+
+def split_set_norm(x: str) -> set:
+    if not x: return set()
+    return {strip_accents(t).lower().strip() for t in x.split("|") if t.strip()}
@@ -0,0 +1,94 @@
+# medsim/partitions.py — catalogue découpé par pays : un CSV (et un cache) par partition
+#
+#   python -m medsim.partitions data_full.csv -o catalogue     # catalogue/MA.csv, …
+#
+#   cat = Catalogue("catalogue")
+#   cat.countries()               # ["MA", …] : simple liste des fichiers, rien n'est chargé
+#   eng = cat.engine(["MA"])      # seules les partitions choisies sont chargées et indexées
+#
+# Chaque partition est un CSV ordinaire : son cache disque, son rechargement incrémental
+# et son moteur en mémoire (LiveEngine) sont propres. Plusieurs pays choisis ensemble
+# donnent un moteur dont l'index est fusionné à partir de ceux des partitions.
+
+import argparse
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from .engine import CHUNK_ROWS, LiveEngine, SimilarityEngine
+
+PARTITION_COLUMN = "source_country"
+NO_COUNTRY = "XX"     # partition des lignes sans pays
+COMBINED_KEPT = 4     # réunions de partitions gardées en mémoire
+
+def partition_name(country) -> str:
+    """Nom de fichier d'un code pays : majuscules, caractères alphanumériques seulement."""
+    code = "".join(c for c in (country if isinstance(country, str) else "").upper() if c.isalnum())
+    return code or NO_COUNTRY
+
+def split_catalogue(csv_path: str, out_dir: str, chunksize: int = CHUNK_ROWS) -> dict:
+    """Répartit un CSV global en ``<out_dir>/<PAYS>.csv`` (toutes colonnes conservées), par
+    paquets ; renvoie le nombre de lignes par partition."""
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    rows = {}
+    for chunk in pd.read_csv(csv_path, dtype=str, chunksize=chunksize):
+        keys = (chunk[PARTITION_COLUMN] if PARTITION_COLUMN in chunk.columns
+                else pd.Series("", index=chunk.index)).map(partition_name)
+        for name, part in chunk.groupby(keys, sort=True):
+            first = name not in rows
+            part.to_csv(out / f"{name}.csv", mode="w" if first else "a", header=first, index=False)
+            rows[name] = rows.get(name, 0) + len(part)
+    return rows
+
+class Catalogue:
+    """Répertoire de partitions ``<PAYS>.csv`` ; les moteurs sont créés à la demande."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.live = {}                # pays -> LiveEngine, à la première sélection
+        self.combined = OrderedDict() # empreintes des partitions -> moteur réuni (LRU)
+        self.lock = threading.Lock()
+
+    def countries(self) -> list[str]:
+        return sorted(p.stem for p in self.directory.glob("*.csv"))
+
+    def partition(self, country: str) -> LiveEngine:
+        with self.lock:
+            if country not in self.live:
+                self.live[country] = LiveEngine(str(self.directory / f"{country}.csv"))
+            return self.live[country]
+
+    def engine(self, countries) -> SimilarityEngine | None:
+        """Moteur des pays choisis (None si aucun) ; une réunion déjà construite pour les
+        mêmes versions de partitions est réutilisée."""
+        engines = [self.partition(c).get() for c in sorted(set(countries))]
+        if len(engines) <= 1:
+            return engines[0] if engines else None
+        key = tuple(e.fingerprint for e in engines)
+        with self.lock:
+            if key in self.combined:
+                self.combined.move_to_end(key)
+                return self.combined[key]
+        eng = SimilarityEngine.combine(engines)
+        with self.lock:
+            self.combined[key] = eng
+            while len(self.combined) > COMBINED_KEPT:
+                self.combined.popitem(last=False)
+        return eng
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.partitions",
+                                 description="Découpe un catalogue CSV en une partition par pays.")
+    ap.add_argument("csv", help="CSV global (colonne source_country)")
+    ap.add_argument("-o", "--output", required=True, help="répertoire des partitions")
+    args = ap.parse_args(argv)
+    for name, n in split_catalogue(args.csv, args.output).items():
+        print(f"{name:<6} {n:>9} lignes -> {Path(args.output) / (name + '.csv')}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+# medsim/prices.py — prix et quantités par boîte en tableaux numériques (pandas, par valeur distincte)
+#
+#   numeric_column(df["ppv_value"], price_col)           # "582.00 dhs" -> 582.0, vide -> nan
+#   numeric_column(df["presentation"], pack_quantity_col)  # "Boite de 30" -> 30.0
+#
+# Comme medsim.columns, chaque valeur distincte n'est convertie qu'une fois.
+
+import numpy as np
+import pandas as pd
+
+PRICE = r"(\d[\d\s]*(?:[.,]\d+)?)"
+# première quantité de la présentation : un nombre, ou « un(e) », « d'un(e) », « unitaire » (= 1)
+QUANTITY = r"(\d+(?:[.,]\d+)?|unitaire|\bd'une?\b|\bune?\b)"
+
+def numeric_column(col, transform) -> np.ndarray:
+    """transform(Series des valeurs distinctes de col) en float64 redistribué sur les lignes ;
+    nan pour les valeurs manquantes."""
+    codes, uniques = pd.factorize(np.asarray(col, dtype=object))
+    vals = transform(pd.Series(uniques, dtype=object)).to_numpy(dtype=np.float64) if len(uniques) else np.empty(0)
+    return np.append(vals, np.nan)[codes]  # code -1 (valeur manquante) -> nan
+
+def price_col(u: pd.Series) -> pd.Series:
+    """« 582.00 dhs », « 1 234,50 », « 42.0 » -> float ; nan si aucun nombre."""
+    num = u.astype(str).str.extract(PRICE, expand=False)
+    return pd.to_numeric(num.str.replace(r"\s", "", regex=True).str.replace(",", ".", regex=False), errors="coerce")
+
+def pack_quantity_col(u: pd.Series) -> pd.Series:
+    """Unités par boîte (comprimés, ml, g…) : « Boite de 30 » -> 30, « Flacon de 60 ml » -> 60,
+    « 5 ampoules de 20 ml » -> 5, « Boite unitaire » -> 1 ; nan si rien n'est lisible."""
+    found = u.astype(str).str.lower().str.extract(QUANTITY, expand=False)
+    q = pd.to_numeric(found.str.replace(",", ".", regex=False), errors="coerce")
+    q = q.mask(found.notna() & q.isna(), 1.0)
+    return q.where(q > 0)
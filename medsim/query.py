@@ -0,0 +1,113 @@
+# medsim/query.py — requêtes booléennes sur les molécules (listes inversées de l'index)
+#
+#   amoxicilline et acide clavulanique        (ET, AND, +)
+#   paracetamol sauf codeine                   (SAUF, SANS, NOT, NON : « et pas »)
+#   (ibuprofene ou ketoprofene) sauf codeine   (OU, OR ; parenthèses)
+#
+# Un terme est un nom de molécule (sans accents ni casse), résolu sur le vocabulaire de
+# l'index : nom exact, sinon noms qui commencent par le terme, puis qui le contiennent, puis
+# le plus proche au fuzzy. L'évaluation combine des tableaux triés de positions ; une
+# négation reste un complément symbolique jusqu'à la fin : le coût suit la taille des listes
+# touchées, pas celle du catalogue (sauf requête purement négative, complétée sur tout le jeu).
+
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+from .normalize import strip_accents
+
+OPERATORS = {"et": "AND", "and": "AND", "+": "AND", "&": "AND",
+             "ou": "OR", "or": "OR",
+             "sauf": "NOT", "sans": "NOT", "not": "NOT", "non": "NOT"}
+TOKEN = re.compile(r"\s*(\(|\)|\+|&|[^\s()+&]+)")
+
+def tokenize(expr: str) -> list:
+    """[(type, valeur)] : opérateurs, parenthèses et termes (mots consécutifs réunis)."""
+    out = []
+    for word in TOKEN.findall(strip_accents(expr).lower()):
+        kind = OPERATORS.get(word) or {"(": "(", ")": ")"}.get(word, "TERM")
+        if kind == "TERM" and out and out[-1][0] == "TERM":
+            out[-1] = ("TERM", out[-1][1] + " " + word)
+        else:
+            out.append((kind, word))
+    return out
+
+def parse(expr: str):
+    """Arbre ("TERM", nom) | ("NOT", a) | ("AND"/"OR", a, b). ValueError si mal formée.
+    Priorités : NOT > AND > OR ; « a sauf b » se lit « a et non b »."""
+    tokens = tokenize(expr)
+    if not tokens:
+        raise ValueError("requête vide")
+    pos = 0
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+    def take(kind):
+        nonlocal pos
+        if peek() != kind:
+            raise ValueError(f"« {kind if kind != 'TERM' else 'molécule'} » attendu"
+                             + (f" avant « {tokens[pos][1]} »" if pos < len(tokens) else " en fin de requête"))
+        pos += 1
+        return tokens[pos - 1][1]
+    def disjunction():
+        node = conjunction()
+        while peek() == "OR":
+            take("OR")
+            node = ("OR", node, conjunction())
+        return node
+    def conjunction():
+        node = unary()
+        while peek() in ("AND", "NOT"):  # NOT après un terme : « et non »
+            if peek() == "AND": take("AND")
+            node = ("AND", node, unary())
+        return node
+    def unary():
+        if peek() == "NOT":
+            take("NOT")
+            return ("NOT", unary())
+        if peek() == "(":
+            take("(")
+            node = disjunction()
+            take(")")
+            return node
+        return ("TERM", take("TERM"))
+    tree = disjunction()
+    if pos < len(tokens):
+        raise ValueError(f"« {tokens[pos][1]} » inattendu")
+    return tree
+
+def resolve(term: str, names: list, fuzzy=None) -> list:
+    """Molécules de ``names`` (vocabulaire trié) désignées par ``term`` : nom exact, sinon
+    préfixe, sinon sous-chaîne, sinon ``fuzzy(term, names)`` (nom ou None)."""
+    lo = bisect_left(names, term)
+    if lo < len(names) and names[lo] == term:
+        return [term]
+    hi = bisect_left(names, term + "\U0010ffff", lo)
+    if hi > lo:
+        return names[lo:hi]
+    found = [m for m in names if term in m]
+    if found or fuzzy is None:
+        return found
+    best = fuzzy(term, names)
+    return [best] if best else []
+
+def evaluate(tree, lookup, n: int) -> np.ndarray:
+    """Positions triées satisfaisant ``tree`` ; ``lookup(terme)`` renvoie les positions triées
+    des lignes contenant le terme, ``n`` le nombre de lignes du jeu."""
+    def ev(node):  # (positions triées, complément ?)
+        op = node[0]
+        if op == "TERM":
+            return lookup(node[1]), False
+        if op == "NOT":
+            a, neg = ev(node[1])
+            return a, not neg
+        (a, na), (b, nb) = ev(node[1]), ev(node[2])
+        if op == "OR":  # a ∪ b = ¬(¬a ∩ ¬b)
+            na, nb = not na, not nb
+        if not na and not nb: res, neg = np.intersect1d(a, b, assume_unique=True), False
+        elif na and nb:       res, neg = np.union1d(a, b), True
+        elif nb:              res, neg = np.setdiff1d(a, b, assume_unique=True), False
+        else:                 res, neg = np.setdiff1d(b, a, assume_unique=True), False
+        return (res, not neg) if op == "OR" else (res, neg)
+    res, neg = ev(tree)
+    return np.setdiff1d(np.arange(n), res, assume_unique=True) if neg else res
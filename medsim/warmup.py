@@ -0,0 +1,40 @@
+# medsim/warmup.py — préchauffage avant mise en service (déploiement progressif)
+#
+#   python -m medsim.warmup data_full_with_dr_luna.csv && streamlit run app.py
+#   python -m medsim.warmup catalogue/*.csv                # partitions par pays
+#
+# Charge, indexe et préchauffe chaque CSV comme le fait LiveEngine.start() au lancement des
+# applications : le cache disque est ainsi à jour (ou reconstruit) avant que la nouvelle
+# instance ne reçoive du trafic, et son premier chargement n'est plus qu'une lecture du cache.
+# Code de sortie 1 si un des fichiers n'a pas pu être chargé.
+
+import argparse
+import sys
+
+from .engine import LiveEngine
+
+def warm_files(paths: list[str]) -> dict:
+    """{chemin: status()} après chargement et préchauffage de chaque CSV, l'un après l'autre."""
+    out = {}
+    for path in paths:
+        live = LiveEngine(path).start()
+        live.thread.join()
+        out[path] = live.status()
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m medsim.warmup",
+                                 description="Charge, indexe et met en cache des CSV avant le lancement des applications.")
+    ap.add_argument("csv", nargs="+", help="CSV de référence ou partitions")
+    args = ap.parse_args(argv)
+    ok = True
+    for path, st in warm_files(args.csv).items():
+        if st["state"] == "ready":
+            print(f"{path} : {st['rows']} lignes prêtes en {st['seconds']:.2f} s", file=sys.stderr)
+        else:
+            ok = False
+            print(f"{path} : échec ({st['error']})", file=sys.stderr)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# tests/test_columns.py — versions colonne de la normalisation = versions scalaires (python -m pytest -q)
+
+from medsim.columns import check
+
+def test_columns_match_scalar():
+    # CSV livrés et cas limites : aucun écart
+    assert check(["data_full.csv", "data_full_with_dr_luna.csv"]) == 0
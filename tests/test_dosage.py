@@ -0,0 +1,23 @@
+# tests/test_dosage.py — dosages en unités canoniques (python -m pytest -q)
+
+import pytest
+
+from medsim.dosage import canonical_doses, parse_strength
+
+@pytest.mark.parametrize("token, expected", [
+    ("100 µg", (0.1, "mg")), ("100 mcg", (0.1, "mg")), ("1 g", (1000.0, "mg")), ("500 mg", (500.0, "mg")),
+    ("2,5 mg", (2.5, "mg")), ("0.5 l", (500.0, "ml")), ("1 000 ui", (1000.0, "ui")), ("5 %", (5.0, "%")),
+    ("500", (500.0, "")), ("ml", (1.0, "ml")),
+    ("extrait sec de melisse 200 mg", None), ("dose", None), ("10 zz", None), ("", None),
+])
+def test_parse_strength(token, expected):
+    got = parse_strength(token)
+    assert got == expected if expected is None else got == pytest.approx(expected)
+
+def test_canonical_doses():
+    assert canonical_doses("1 g | 125 mg") == canonical_doses("1000 mg | 125 mg") == {"1000 mg", "125 mg"}
+    assert canonical_doses("100 µg") == canonical_doses("0,1 mg") == {"0.1 mg"}
+    assert canonical_doses("1 000 ui") == canonical_doses("1000 ui")
+    assert canonical_doses("500 mg") != canonical_doses("500 ml")
+    assert canonical_doses("dose | 5 mg") == {"dose", "5 mg"}  # partie non reconnue : telle quelle
+    assert canonical_doses("") == frozenset()
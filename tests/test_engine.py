@@ -0,0 +1,22 @@
+# tests/test_engine.py — SimilarityEngine : cache de résultats (python -m pytest -q)
+
+import pytest
+
+from medsim.cache import ResultCache
+from medsim.engine import SimilarityEngine, load_data
+
+@pytest.fixture(scope="module")
+def frame():
+    return load_data("data_full_with_dr_luna.csv")
+
+@pytest.mark.parametrize("first", [0, 1])
+def test_cache_shared_by_whitespace_variants(frame, first):
+    # deux saisies qui partagent une entrée du cache donnent le même résultat, dans tout ordre
+    eng = SimilarityEngine(*frame, results=ResultCache())
+    for a, b, call in ((("acide  folique", "acide folique", lambda q: eng.suggest(q))),
+                       (("doliprane  1", "doliprane 1", lambda q: eng.search(q)[0].name)),
+                       (("paracetamol  sauf codeine", "paracetamol sauf codeine",
+                         lambda q: eng.molecule_query(q)[0]))):
+        pair = (a, b) if first == 0 else (b, a)
+        assert call(pair[0]) == call(pair[1])
+    assert eng.suggest("acide  folique")
@@ -0,0 +1,50 @@
+# tests/test_index.py — index incrémental et fusionné = index reconstruit (python -m pytest -q)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from medsim.engine import compact_frame, prepare_frame, read_csv
+from medsim.index import build_index, match_rows, merge_indexes, patch_index
+
+def same(a, b) -> bool:
+    """Égalité profonde de deux index (dicts, listes, tableaux numpy)."""
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.asarray(a).dtype == np.asarray(b).dtype and np.array_equal(a, b)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+def assert_same_frame(a, b):
+    pd.testing.assert_frame_equal(a.astype(object), b.astype(object))
+
+@pytest.fixture(scope="module")
+def raw():
+    return read_csv("data_full_with_dr_luna.csv")
+
+def test_patch_index_matches_build_index(raw):
+    # nouvelle version : lignes supprimées, modifiées, ajoutées, et ordre mélangé
+    old_raw = raw.iloc[:4000]
+    new_raw = pd.concat([raw.iloc[:4000].drop(index=range(0, 4000, 7)), raw.iloc[4000:]])
+    edited = new_raw.index[::11]
+    new_raw.loc[edited, "grammages"] = new_raw.loc[edited, "grammages"].fillna("") + " 5 mg"
+    new_raw.loc[edited[::2], "molecules"] = "paracetamol"
+    new_raw = new_raw.sample(frac=1, random_state=0).reset_index(drop=True)
+    old_df = prepare_frame(old_raw)
+    old_index = build_index(old_df)
+    old_pos = match_rows(new_raw, old_df, old_index)
+    assert (old_pos >= 0).any() and (old_pos < 0).any()
+    df = prepare_frame(new_raw, reuse=(old_df, old_pos))
+    full = prepare_frame(new_raw)
+    assert_same_frame(df, full)
+    assert same(patch_index(old_index, df, old_pos), build_index(full))
+
+def test_merge_indexes_matches_build_index(raw):
+    # partitions indexées séparément puis réunies = jeu complet indexé d'un coup
+    parts = [prepare_frame(raw.iloc[a:b]) for a, b in ((0, 1500), (1500, 1501), (1501, len(raw)))]
+    df = compact_frame(pd.concat(parts, ignore_index=True))
+    full = prepare_frame(raw)
+    assert_same_frame(df, full)
+    assert same(merge_indexes(df, [build_index(p) for p in parts]), build_index(full))
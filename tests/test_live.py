@@ -0,0 +1,41 @@
+# tests/test_live.py — LiveEngine : rafraîchissement en arrière-plan (python -m pytest -q)
+
+import os
+
+from medsim.engine import LiveEngine
+
+HEADER = "specialite,molecules,forme,detail_url\n"
+ROWS = "".join(f"NOM{i},paracetamol,cp,https://x/{i}\n" for i in range(4))
+
+def test_refresh_in_background(tmp_path):
+    csv = tmp_path / "data.csv"
+    csv.write_text(HEADER + ROWS, encoding="utf-8")
+    live = LiveEngine(str(csv))
+    old = live.get()
+    csv.write_text(HEADER + ROWS + "NOM9,ibuprofene,cp,https://x/9\n", encoding="utf-8")
+    st = os.stat(csv)
+    os.utime(csv, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert live.get() is old  # celui qui voit le nouveau mtime n'attend pas le rechargement
+    live.refresher.join()
+    new = live.get()
+    assert new is not old and new.n == 5 and live.status()["refresh_error"] is None
+    assert live.get() is new
+
+def test_refresh_failure_keeps_old_engine(tmp_path):
+    csv = tmp_path / "data.csv"
+    csv.write_text(HEADER + ROWS, encoding="utf-8")
+    live = LiveEngine(str(csv))
+    old = live.get()
+    csv.write_bytes(b"")  # fichier vide : illisible
+    st = os.stat(csv)
+    os.utime(csv, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    live.get()
+    failed = live.refresher
+    failed.join()
+    assert live.get() is old and live.status()["refresh_error"]
+    assert live.refresher is failed  # même mtime : le fichier illisible n'est pas relu
+    csv.write_text(HEADER + ROWS + "NOM9,ibuprofene,cp,https://x/9\n", encoding="utf-8")
+    os.utime(csv, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+    live.get()
+    live.refresher.join()  # nouveau mtime : nouvel essai
+    assert live.get().n == 5 and live.status()["refresh_error"] is None
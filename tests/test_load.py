@@ -0,0 +1,51 @@
+# tests/test_load.py — chargement de CSV limites (python -m pytest -q)
+
+import os
+
+import pandas as pd
+import pytest
+
+from medsim import engine
+from medsim.engine import SimilarityEngine, load_data
+
+FOUR_ROWS = "specialite,molecules,forme\nFOO,paracetamol,cp\nFOO,paracetamol,cp\nFOO,paracetamol,cp\nBAR,paracetamol,cp\n"
+HEADER_ONLY = "specialite,molecules,forme\n"
+
+@pytest.mark.parametrize("content", [FOUR_ROWS, HEADER_ONLY], ids=["categorical-no-blank", "header-only"])
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_load_edge_cases(tmp_path, content, use_cache):
+    # colonnes catégorielles sans valeur vide, jeu vide : chargement, cache et recherche
+    csv = tmp_path / "data.csv"
+    csv.write_text(content, encoding="utf-8")
+    for _ in range(2 if use_cache else 1):  # second passage : relu depuis le cache
+        eng = SimilarityEngine(*load_data(str(csv), use_cache=use_cache))
+        assert eng.n == content.count("\n") - 1
+        ref, _ = eng.search("foo", [], [])
+        assert (ref is not None) == (eng.n > 0)
+
+def test_refresh_categorical_no_blank(tmp_path):
+    # rechargement incrémental (row_hashes sur un jeu catégoriel) = chargement complet
+    csv = tmp_path / "data.csv"
+    csv.write_text(FOUR_ROWS, encoding="utf-8")
+    load_data(str(csv))
+    csv.write_text(FOUR_ROWS + "BAZ,ibuprofene,cp\n", encoding="utf-8")
+    df, _ = load_data(str(csv))
+    full, _ = load_data(str(csv), use_cache=False)
+    pd.testing.assert_frame_equal(df.astype(object), full.astype(object))
+
+def test_csv_rewritten_while_loading(tmp_path, monkeypatch):
+    # CSV réécrit juste après sa lecture : l'en-tête du cache garde le stat d'avant le hachage,
+    # le chargement suivant rehache et voit la nouvelle version
+    csv = tmp_path / "data.csv"
+    csv.write_text(FOUR_ROWS, encoding="utf-8")
+    read_csv = engine.read_csv
+    def read_then_rewrite(path):
+        raw = read_csv(path)
+        csv.write_text(FOUR_ROWS + "BAZ,ibuprofene,cp\n", encoding="utf-8")
+        st = os.stat(csv)
+        os.utime(csv, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        return raw
+    monkeypatch.setattr(engine, "read_csv", read_then_rewrite)
+    assert len(load_data(str(csv))[0]) == 4
+    monkeypatch.undo()
+    assert len(load_data(str(csv))[0]) == 5
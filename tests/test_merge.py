@@ -0,0 +1,44 @@
+# tests/test_merge.py — fusion de CSV sources (python -m pytest -q)
+
+import pandas as pd
+
+from medsim.merge import merge_sources
+
+HEADER = "specialite,molecules,forme,detail_url,last_seen\n"
+
+def merged(tmp_path, *sources, chunksize=2):
+    paths = []
+    for i, text in enumerate(sources):
+        p = tmp_path / f"src{i}.csv"
+        p.write_text(HEADER + text, encoding="utf-8")
+        paths.append(str(p))
+    out = tmp_path / "out.csv"
+    stats = merge_sources(paths, str(out), chunksize=chunksize)
+    return pd.read_csv(out, dtype=str, keep_default_na=False), stats
+
+def test_precedence(tmp_path):
+    # la plus récente selon last_seen, puis à date égale la source citée en dernier
+    a = ("A1,paracetamol,cp,https://x/1,2024-03-01\n"
+         "A2,paracetamol,cp,https://x/2,2024-01-01\n"
+         "A3,paracetamol,cp,https://x/3,2024-01-01\n")
+    b = ("B1,paracetamol,cp,https://x/1,2024-01-01\n"
+         "B2,paracetamol,cp,https://x/2,2024-03-01\n"
+         "B3,paracetamol,cp,https://x/3,2024-01-01\n")
+    df, stats = merged(tmp_path, a, b)
+    assert sorted(df["specialite"]) == ["A1", "B2", "B3"]
+    assert stats["rows"] == 6 and stats["kept"] == 3 and stats["duplicates"] == 3
+
+def test_key_normalization(tmp_path):
+    # URL sans schéma, « www. », casse ni « / » final ; contenu sans espaces de tête ni de fin
+    a = ("A1,paracetamol,cp,https://www.site.ma/med/1/,2024-01-01\n"
+         "X,ibuprofene , cp,,2024-01-01\n")
+    b = ("B1,paracetamol,cp, http://SITE.ma/med/1,2024-01-01\n"
+         " X,ibuprofene,cp,,2024-02-01\n")
+    df, stats = merged(tmp_path, a, b)
+    assert stats["kept"] == 2
+    assert df.to_dict("records") == [
+        {"specialite": "B1", "molecules": "paracetamol", "forme": "cp",
+         "detail_url": "http://SITE.ma/med/1", "last_seen": "2024-01-01"},
+        {"specialite": "X", "molecules": "ibuprofene", "forme": "cp",
+         "detail_url": "", "last_seen": "2024-02-01"},
+    ]
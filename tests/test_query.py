@@ -0,0 +1,42 @@
+# tests/test_query.py — requêtes booléennes sur les molécules (python -m pytest -q)
+
+import numpy as np
+import pytest
+
+from medsim.query import evaluate, parse
+
+T = lambda name: ("TERM", name)
+
+@pytest.mark.parametrize("expr, tree", [
+    ("amoxicilline et acide clavulanique", ("AND", T("amoxicilline"), T("acide clavulanique"))),
+    ("a ou b et c", ("OR", T("a"), ("AND", T("b"), T("c")))),
+    ("(a ou b) et c", ("AND", ("OR", T("a"), T("b")), T("c"))),
+    ("a sauf b", ("AND", T("a"), ("NOT", T("b")))),
+    ("a sauf b ou c", ("OR", ("AND", T("a"), ("NOT", T("b"))), T("c"))),
+    ("non a", ("NOT", T("a"))),
+    ("Paracétamol + Codéine", ("AND", T("paracetamol"), T("codeine"))),
+])
+def test_parse(expr, tree):
+    assert parse(expr) == tree
+
+@pytest.mark.parametrize("expr", ["", "  ", "a et", "et a", "a ou ou b", "(a", "a)", "()", "a sauf"])
+def test_parse_malformed(expr):
+    with pytest.raises(ValueError):
+        parse(expr)
+
+# 8 lignes : a sur 0-3, b sur 2-5, c sur 5-6
+POSTINGS = {"a": np.array([0, 1, 2, 3]), "b": np.array([2, 3, 4, 5]), "c": np.array([5, 6])}
+
+@pytest.mark.parametrize("expr, expected", [
+    ("a et b", [2, 3]),
+    ("a ou b", [0, 1, 2, 3, 4, 5]),
+    ("a sauf b", [0, 1]),
+    ("a ou b et c", [0, 1, 2, 3, 5]),
+    ("(a ou b) et c", [5]),
+    ("non a", [4, 5, 6, 7]),
+    ("non a et non c", [4, 7]),
+    ("non (a ou b)", [6, 7]),
+    ("non a ou c", [4, 5, 6, 7]),
+])
+def test_evaluate(expr, expected):
+    assert evaluate(parse(expr), POSTINGS.__getitem__, 8).tolist() == expected
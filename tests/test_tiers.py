@@ -0,0 +1,52 @@
+# tests/test_tiers.py — tiers de l'index = group_similars d'origine, par force brute (python -m pytest -q)
+
+import pytest
+
+from medsim.dosage import canonical_doses
+from medsim.engine import SimilarityEngine, load_data
+from medsim.normalize import split_set_norm
+
+COLS = ["specialite", "detail_url", "molecules_norm", "forme_norm", "grammages_norm", "atc_code", "statut"]
+
+@pytest.fixture(scope="module")
+def engine():
+    eng = SimilarityEngine(*load_data("data_full_with_dr_luna.csv"))
+    eng.rows_ = eng.df[COLS].astype(object).fillna("").to_dict("records")
+    for r in eng.rows_:
+        r["mols"], r["dos"] = split_set_norm(r["molecules_norm"]), split_set_norm(r["grammages_norm"])
+    return eng
+
+def baseline_tiers(rows, ref_pos, in_view):
+    """group_similars d'avant l'index (boucle sur les lignes, dosages comparés en texte)."""
+    ref = rows[ref_pos]
+    ref_mols, ref_form, ref_dos, ref_atc = ref["mols"], ref["forme_norm"], ref["dos"], ref["atc_code"].strip()
+    tiers = {"A": [], "B": [], "C": [], "D": []}
+    for i, r in enumerate(rows):
+        if in_view is not None and not in_view[i]: continue
+        if r["specialite"] == ref["specialite"] and r["detail_url"] == ref["detail_url"]: continue
+        exact = r["mols"] == ref_mols and len(r["mols"]) > 0
+        subset = len(ref_mols) > 0 and ref_mols.issubset(r["mols"])
+        same_form = r["forme_norm"] == ref_form and ref_form != ""
+        if exact and same_form and r["dos"] and r["dos"] == ref_dos: tiers["A"].append(i)
+        elif (exact or subset) and same_form: tiers["B"].append(i)
+        elif exact or subset: tiers["C"].append(i)
+        elif ref_atc and r["atc_code"].strip() == ref_atc: tiers["D"].append(i)
+    key = lambda i: (0 if rows[i]["statut"].lower().startswith("com") else 1, rows[i]["specialite"])
+    return {k: sorted(v, key=key) for k, v in tiers.items()}
+
+@pytest.mark.parametrize("filters", [((), ()), (("COMPRIME",), ()), (("GELULE", "SOLUTION"), ("Commercialisé",))],
+                         ids=["sans-filtre", "forme", "forme-statut"])
+def test_tiers_match_baseline(engine, filters):
+    rows, in_view = engine.rows_, engine.selection(*filters)
+    moved = 0
+    for ref_pos in range(0, engine.n, 61):
+        got, exp = engine.tier_positions(ref_pos, in_view), baseline_tiers(rows, ref_pos, in_view)
+        # seuls écarts admis : B -> A quand les dosages ne diffèrent que par l'écriture (« 1 g » / « 1000 mg »)
+        same_dose = lambda i: canonical_doses(rows[i]["grammages_norm"]) == canonical_doses(rows[ref_pos]["grammages_norm"])
+        extra = [i for i in got["A"] if i not in exp["A"]]
+        assert all(i in exp["B"] and rows[i]["mols"] == rows[ref_pos]["mols"] and same_dose(i) for i in extra)
+        moved += len(extra)
+        assert [i for i in got["A"] if i not in extra] == exp["A"]
+        assert got["B"] == [i for i in exp["B"] if i not in extra]
+        assert got["C"] == exp["C"] and got["D"] == exp["D"]
+    assert moved < 0.05 * engine.n